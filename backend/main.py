@@ -1,6 +1,10 @@
 """FastAPI server for ETL pipeline."""
+import asyncio
+
 from fastapi import FastAPI, APIRouter, File, UploadFile, Form, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
@@ -8,7 +12,9 @@ import os
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
-import shutil
+import aiofiles
+
+import uuid
 
 from modules.etl_pipeline import ETLPipeline
 from modules.schema_manager import SchemaManager
@@ -25,9 +31,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
+# MongoDB connection. A larger pool lets concurrent requests (and the
+# per-collection gather fan-outs) check out sockets without queuing; a
+# small warm minimum avoids connection-setup latency on the first burst.
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, maxPoolSize=50, minPoolSize=5)
 db = client[os.environ.get('DB_NAME', 'etl_database')]
 
 # Initialize components
@@ -36,9 +44,15 @@ schema_manager = SchemaManager(db)
 query_executor = QueryExecutor(db)
 
 # FastAPI app
-app = FastAPI(title="ETL Pipeline API")
+# orjson serializes the large /records and /query payloads far faster
+# than the stdlib encoder
+app = FastAPI(title="ETL Pipeline API", default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
+# Compress large JSON responses (schemas, query results, records);
+# small payloads skip the gzip cost entirely
+app.add_middleware(GZipMiddleware, minimum_size=4096)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -79,19 +93,14 @@ class QueryResponse(BaseModel):
     execution_result: Optional[List[Dict[str, Any]]] = None
     error: Optional[Dict[str, str]] = None
 
-# Endpoints
-@api_router.post("/upload", response_model=UploadResponse)
-async def upload_file(
-    file: UploadFile = File(...),
-    source_id: str = Form(...)
-):
-    """Upload and process a file through ETL pipeline.
-    
-    Accepts: .txt, .pdf, .md files containing HTML, JSON, CSV data
-    """
-    logger.info(f"Received upload request: source_id={source_id}, filename={file.filename}")
-    
-    # Validate file type
+# In-memory registry for background ETL runs started via /upload/async.
+# Entries are one small dict each; finished ones are evicted when the
+# registry fills up.
+_jobs: Dict[str, Dict[str, Any]] = {}
+_JOBS_CAP = 256
+
+async def _save_upload(file: UploadFile, source_id: str) -> Path:
+    """Validate and persist an uploaded file, returning its path."""
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in ['.txt', '.pdf', '.md']:
         raise HTTPException(
@@ -99,22 +108,82 @@ async def upload_file(
             detail=f"Unsupported file type: {file_ext}. Only .txt, .pdf, .md allowed."
         )
     
-    # Save uploaded file
+    # Save uploaded file with chunked async writes so a large upload does
+    # not block the event loop or double-copy through Python buffers
     file_path = UPLOAD_DIR / f"{source_id}_{file.filename}"
     try:
-        with open(file_path, 'wb') as f:
-            shutil.copyfileobj(file.file, f)
+        async with aiofiles.open(file_path, 'wb') as f:
+            while chunk := await file.read(1 << 20):
+                await f.write(chunk)
     except Exception as e:
         logger.error(f"Error saving file: {e}")
         raise HTTPException(status_code=500, detail=f"Error saving file: {e}")
     finally:
-        file.file.close()
+        await file.close()
+    return file_path
+
+# Endpoints
+@api_router.post("/upload", response_model=UploadResponse)
+async def upload_file(
+    file: UploadFile = File(...),
+    source_id: str = Form(...)
+):
+    """Upload and process a file through ETL pipeline.
+    
+    Accepts: .txt, .pdf, .md files containing HTML, JSON, CSV data
+    """
+    logger.info(f"Received upload request: source_id={source_id}, filename={file.filename}")
+    
+    file_path = await _save_upload(file, source_id)
     
     # Process file through ETL pipeline
     result = await etl_pipeline.process_file(str(file_path), source_id)
     
     return result
 
+@api_router.post("/upload/async")
+async def upload_file_async(
+    file: UploadFile = File(...),
+    source_id: str = Form(...)
+):
+    """Start an ETL run in the background and return a job id to poll.
+
+    The synchronous /upload holds the HTTP request open for the whole
+    pipeline run; this variant returns as soon as the file is saved, and
+    clients follow progress via GET /jobs/{job_id}.
+    """
+    logger.info(f"Received async upload request: source_id={source_id}, filename={file.filename}")
+    
+    file_path = await _save_upload(file, source_id)
+    
+    if len(_jobs) >= _JOBS_CAP:
+        for finished in [jid for jid, job in _jobs.items() if job["task"].done()]:
+            del _jobs[finished]
+    job_id = uuid.uuid4().hex
+    _jobs[job_id] = {"status": "running", "result": None, "error": None}
+    
+    async def _run():
+        try:
+            result = await etl_pipeline.process_file(str(file_path), source_id)
+            _jobs[job_id].update(status="done", result=result)
+        except Exception as e:
+            logger.error(f"Background ETL job {job_id} failed: {e}")
+            _jobs[job_id].update(status="error", error=str(e))
+    
+    # Keep a strong reference to the task: the event loop only holds a
+    # weak one, and a garbage-collected task would leave the job stuck at
+    # "running" with the client polling forever
+    _jobs[job_id]["task"] = asyncio.create_task(_run())
+    return {"job_id": job_id, "status": "running"}
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll the status of a background ETL job."""
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No such job: {job_id}")
+    return {"job_id": job_id, **{k: v for k, v in job.items() if k != "task"}}
+
 @api_router.get("/schema", response_model=SchemaResponse)
 async def get_schema(source_id: str = Query(...)):
     """Get schema for a source."""
@@ -134,7 +203,9 @@ async def get_schema(source_id: str = Query(...)):
 @api_router.post("/query", response_model=QueryResponse)
 async def execute_query(request: QueryRequest):
     """Execute a query (Natural Language or Direct DB query)."""
-    logger.info(f"Query request: {request.model_dump()}")
+    # Don't serialize the whole request model per call; query text can be
+    # large and executors already log the translated query
+    logger.info(f"Query request: source_id={request.source_id}, type={request.query_type}")
     
     # Get schema
     schema = await schema_manager.get_schema(request.source_id)
@@ -183,15 +254,18 @@ async def get_records(
             detail=f"No schema found for source_id={source_id}"
         )
     
-    all_records = []
     collections = schema.get('collections', {})
-    
-    for collection_name in collections.keys():
-        collection = db[collection_name]
-        records = await collection.find(
+
+    # Fetch all collections concurrently instead of awaiting them one by one
+    results = await asyncio.gather(*(
+        db[collection_name].find(
             {"_source_id": source_id},
             {"_id": 0}
         ).to_list(1000)
+        for collection_name in collections.keys()
+    ))
+    all_records = []
+    for records in results:
         all_records.extend(records)
     
     return {
@@ -200,19 +274,46 @@ async def get_records(
         "records": all_records
     }
 
+@api_router.get("/overview")
+async def get_overview(source_id: str = Query(...)):
+    """Schema plus recent history for a source in one round-trip.
+
+    The frontend needs all three on its history view; fetching them
+    here concurrently replaces three sequential client round-trips.
+    """
+    schema, uploads, queries = await asyncio.gather(
+        schema_manager.get_schema(source_id),
+        etl_pipeline.get_upload_history(source_id, 25, 0),
+        query_executor.get_query_history(source_id, 25, 0),
+    )
+    return {
+        "source_id": source_id,
+        "schema": schema,
+        "recent_uploads": uploads,
+        "recent_queries": queries
+    }
+
 @api_router.get("/history/uploads")
-async def get_upload_history(source_id: str = Query(...)):
-    """Get upload history for a source."""
-    history = await etl_pipeline.get_upload_history(source_id)
+async def get_upload_history(
+    source_id: str = Query(...),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """Get upload history for a source (paged, newest first)."""
+    history = await etl_pipeline.get_upload_history(source_id, limit, offset)
     return {
         "source_id": source_id,
         "uploads": history
     }
 
 @api_router.get("/history/queries")
-async def get_query_history(source_id: str = Query(...)):
-    """Get query history for a source."""
-    history = await query_executor.get_query_history(source_id)
+async def get_query_history(
+    source_id: str = Query(...),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0)
+):
+    """Get query history for a source (paged, newest first)."""
+    history = await query_executor.get_query_history(source_id, limit, offset)
     return {
         "source_id": source_id,
         "queries": history
@@ -234,6 +335,13 @@ async def root():
 # Include router
 app.include_router(api_router)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    await etl_pipeline.ensure_indexes()
+    await query_executor.ensure_indexes()
+    await schema_manager.ensure_indexes()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await query_executor.flush_query_logs()
     client.close()
\ No newline at end of file
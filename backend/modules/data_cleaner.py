@@ -5,6 +5,15 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# Compiled once at import time; _normalize_field_name runs for every field
+# of every record, so avoid the per-call regex cache lookup
+_FIELD_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_FIELD_COLLAPSE = re.compile(r'_+')
+
+# Boolean token sets hoisted out of _clean_value's hot path
+_TRUE_TOKENS = frozenset(('true', 'yes', 'y'))
+_FALSE_TOKENS = frozenset(('false', 'no', 'n'))
+
 class DataCleaner:
     """Clean and canonicalize extracted data."""
     
@@ -20,34 +29,71 @@ class DataCleaner:
         """
         if not records:
             return []
-        
-        # Normalize field names in all records
-        normalized_records = []
-        for record in records:
-            normalized_record = {}
-            for key, value in record.items():
-                clean_key = DataCleaner._normalize_field_name(key)
-                clean_value = DataCleaner._clean_value(value)
-                normalized_record[clean_key] = clean_value
-            normalized_records.append(normalized_record)
-        
+
+        # Tabular batches (CSV/XML/HTML rows) share one key set; clean those
+        # with per-column specialization instead of re-dispatching per cell
+        first = records[0]
+        keys = tuple(first.keys()) if isinstance(first, dict) else None
+        if keys and len(records) > 1 and all(
+            isinstance(r, dict) and tuple(r.keys()) == keys for r in records
+        ):
+            normalized_records = DataCleaner._clean_records_batch(records, keys)
+        else:
+            # Normalize field names in all records
+            normalized_records = []
+            for record in records:
+                normalized_record = {}
+                for key, value in record.items():
+                    clean_key = DataCleaner._normalize_field_name(key)
+                    clean_value = DataCleaner._clean_value(value)
+                    normalized_record[clean_key] = clean_value
+                normalized_records.append(normalized_record)
+
         # Deduplicate records
         deduplicated = DataCleaner._deduplicate_records(normalized_records)
         
         logger.info(f"Cleaned {len(records)} records -> {len(deduplicated)} unique records")
         return deduplicated
     
+    @staticmethod
+    def _clean_records_batch(records: List[Dict[str, Any]], keys: tuple) -> List[Dict[str, Any]]:
+        """Clean a homogeneous batch of records.
+
+        Field names are normalized once per column instead of once per cell,
+        and columns whose sampled values are plain scalars (numbers, bools,
+        None) get a pass-through cleaner: _clean_value would return them
+        unchanged anyway. A type guard keeps stray strings correct if a
+        column turns mixed after the sampled rows.
+        """
+        clean_keys = {key: DataCleaner._normalize_field_name(key) for key in keys}
+
+        cleaners = {}
+        for key in keys:
+            sample = [record[key] for record in records[:50]]
+            if any(isinstance(v, (str, list, dict)) for v in sample):
+                cleaners[key] = DataCleaner._clean_value
+            else:
+                cleaners[key] = (
+                    lambda v: v if not isinstance(v, (str, list, dict))
+                    else DataCleaner._clean_value(v)
+                )
+
+        return [
+            {clean_keys[key]: cleaners[key](value) for key, value in record.items()}
+            for record in records
+        ]
+
     @staticmethod
     def _normalize_field_name(field_name: str) -> str:
         """Normalize field name to lowercase snake_case."""
         # Convert to lowercase
         normalized = field_name.lower()
         # Replace spaces and special characters with underscore
-        normalized = re.sub(r'[^a-z0-9]+', '_', normalized)
+        normalized = _FIELD_NON_ALNUM.sub('_', normalized)
         # Remove leading/trailing underscores
         normalized = normalized.strip('_')
         # Collapse multiple underscores
-        normalized = re.sub(r'_+', '_', normalized)
+        normalized = _FIELD_COLLAPSE.sub('_', normalized)
         return normalized or 'field'
     
     @staticmethod
@@ -59,33 +105,33 @@ class DataCleaner:
         # Handle strings
         if isinstance(value, str):
             value = value.strip()
-            
+
+            # Don't convert empty strings to 0
+            if not value:
+                return None
+
             # --- START FIX: Robust Numeric Conversion ---
             # Try to convert to float first. This handles "4", "4.0", and "4.5"
             try:
-                # Don't convert empty strings to 0
-                if value == "":
-                    return None
-                
                 f_value = float(value)
-                # If it's a whole number, return as int (e.g., 4.0 -> 4)
-                if f_value.is_integer():
-                    return int(f_value)
-                # Otherwise, return the float
-                return f_value
             except (ValueError, TypeError):
                 # Not a float, continue...
                 pass
+            else:
+                # If it's a whole number, return as int (e.g., 4.0 -> 4)
+                # Otherwise, return the float
+                return int(f_value) if f_value.is_integer() else f_value
             # --- END FIX ---
-            
-            # Try boolean
-            if value.lower() in ['true', 'yes', 'y']:
+
+            # Try boolean (lowercase once, membership-test against frozensets)
+            lowered = value.lower()
+            if lowered in _TRUE_TOKENS:
                 return True
-            if value.lower() in ['false', 'no', 'n']:
+            if lowered in _FALSE_TOKENS:
                 return False
-            
+
             # Return cleaned string
-            return value if value else None
+            return value
         
         # Handle lists
         if isinstance(value, list):
@@ -97,25 +143,41 @@ class DataCleaner:
         
         return value
     
+    @staticmethod
+    def _freeze(value: Any) -> Any:
+        """Convert a record value into a hashable canonical form.
+
+        Dicts become sorted tuples of (key, frozen_value), lists become
+        tuples; scalars carry their type. The type tag matters: Python
+        equality collapses 1 == True == 1.0, so untagged keys would
+        collapse records that JSON (and schema inference) treat as
+        distinct.
+        """
+        if isinstance(value, dict):
+            return (dict, tuple(sorted((k, DataCleaner._freeze(v)) for k, v in value.items())))
+        if isinstance(value, list):
+            return (list, tuple(DataCleaner._freeze(v) for v in value))
+        return (value.__class__, value)
+
     @staticmethod
     def _deduplicate_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Remove duplicate records."""
         seen = set()
         unique_records = []
-        
+
         for record in records:
-            # Create a hashable representation
+            # Create a hashable representation without serializing to JSON;
+            # hashing/comparing tuples happens at C level and avoids building
+            # a full string copy of every record
             try:
-                # Convert to JSON string for hashing (handles nested structures)
-                import json
-                record_key = json.dumps(record, sort_keys=True, default=str)
+                record_key = DataCleaner._freeze(record)
                 if record_key not in seen:
                     seen.add(record_key)
                     unique_records.append(record)
-            except (TypeError, ValueError):
+            except TypeError:
                 # If we can't hash it, just add it
                 unique_records.append(record)
-        
+
         return unique_records
     
     @staticmethod
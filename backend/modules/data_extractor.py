@@ -1,22 +1,60 @@
 """Data extractor for identifying and extracting HTML, JSON, CSV, and XML from text."""
+import bisect
 import json
 import csv
 import io
 import re
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
-from bs4 import BeautifulSoup
-from lxml import etree # Make sure you have lxml installed
-from .ollama_client import OllamaClient
+import pandas as pd
+from lxml import etree, html as lxml_html # Make sure you have lxml installed
+from .ollama_client import get_client
 
 logger = logging.getLogger(__name__)
 
+# Patterns compiled once at import; these run on every upload
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_TRAILING_COMMA_RE = re.compile(r',\s*(}|])')
+# Regex to find XML-like structures (starting with '<?xml' or a root tag).
+# The backreference makes the region end at the closing tag of the
+# root element instead of the first closing tag of any element.
+_XML_DOC_RE = re.compile(r'(<\?xml.*?\?>)?\s*<([a-zA-Z_][^\s>/]*)[^>]*>.*?</\2\s*>', re.DOTALL)
+
+# Candidate CSV delimiters, in detection priority order
+_CSV_DELIMS = (',', ';', '\t', '|')
+
+# Root tags that indicate an HTML region rather than a standalone XML document
+_HTML_ROOT_TAGS = frozenset({
+    'html', 'head', 'body', 'table', 'thead', 'tbody', 'tr', 'td', 'th',
+    'div', 'span', 'p', 'ul', 'ol', 'li', 'style', 'script'
+})
+
+# lxml parser objects are reusable but not thread-safe, so keep one per
+# worker thread instead of rebuilding parser state for every fragment
+_PARSER_TLS = threading.local()
+
+def _html_parser() -> lxml_html.HTMLParser:
+    parser = getattr(_PARSER_TLS, 'html_parser', None)
+    if parser is None:
+        parser = _PARSER_TLS.html_parser = lxml_html.HTMLParser(recover=True)
+    return parser
+
+# Shared pool for running the per-format extractors concurrently; they are
+# independent passes over the same text and spend most of their time in
+# C code (json, lxml, regex) that releases the GIL
+_EXTRACT_POOL = ThreadPoolExecutor(max_workers=4)
+
 class DataExtractor:
     """Extract structured data from mixed-format text."""
     
     def __init__(self, use_slm: bool = True):
         self.use_slm = use_slm
-        self.ollama_client = OllamaClient() if use_slm else None
+        self.ollama_client = get_client() if use_slm else None
+        # Re-uploads of the same file are common; remember SLM detection
+        # results keyed by the hash of the probed text
+        self._slm_cache: Dict[int, Dict[str, Any]] = {}
     
     def extract_all_fragments(self, text: str, source_id: str) -> List[Dict[str, Any]]:
         """Extract all HTML, JSON, CSV, and XML fragments from text.
@@ -24,112 +62,153 @@ class DataExtractor:
         Uses hybrid approach: SLM for detection + heuristic parsers for extraction.
         """
         fragments = []
-        
-        # First, try SLM-based detection if enabled
-        if self.use_slm and self.ollama_client:
+
+        # Cheap sentinel pre-scan: each membership test is a single C-level
+        # pass, far cheaper than an extractor run that cannot match anyway
+        maybe_json = '{' in text or '[' in text
+        maybe_markup = '<' in text
+        maybe_csv = ',' in text or ';' in text or '\t' in text or '|' in text
+
+        # Kick off SLM-based detection only when the heuristics are not
+        # clearly going to find fragments on their own: the SLM pass is a
+        # full model inference whose result merely corroborates the
+        # extractors, so skip it for obviously structure-rich text. It is
+        # network-bound and overlaps with the CPU-bound extractors below.
+        slm_future = None
+        slm_key = None
+        if self.use_slm and self.ollama_client and not self._heuristic_confident(text):
+            # Limit text for SLM detection for performance
+            slm_text = text[:5000]
+            slm_key = hash(slm_text)
+            if slm_key in self._slm_cache:
+                logger.info(f"SLM detection cache hit: {self._slm_cache[slm_key]}")
+            else:
+                slm_future = _EXTRACT_POOL.submit(
+                    self.ollama_client.extract_structured_data, slm_text
+                )
+
+        # Split into lines once and share; the HTML and CSV extractors each
+        # used to compute their own copy of the same list
+        lines = text.split('\n') if (maybe_markup or maybe_csv) else None
+
+        # Run the heuristic parsers concurrently; each is an independent
+        # full pass over the text
+        extract_futures = []
+        if maybe_json:
+            extract_futures.append(_EXTRACT_POOL.submit(self._extract_json_fragments, text))
+        if maybe_markup:
+            extract_futures.append(_EXTRACT_POOL.submit(self._extract_html_fragments, text, lines))
+        if maybe_csv:
+            extract_futures.append(_EXTRACT_POOL.submit(self._extract_csv_fragments, text, lines))
+        if maybe_markup:
+            extract_futures.append(_EXTRACT_POOL.submit(self._extract_xml_fragments, text))
+        for future in extract_futures:
+            fragments.extend(future.result())
+
+        if slm_future is not None:
             try:
-                # Limit text for SLM detection for performance
-                slm_result = self.ollama_client.extract_structured_data(text[:5000])
+                slm_result = slm_future.result()
+                if len(self._slm_cache) >= 128:
+                    self._slm_cache.clear()
+                self._slm_cache[slm_key] = slm_result
                 logger.info(f"SLM detected fragments: {slm_result}")
             except Exception as e:
                 logger.warning(f"SLM detection failed, falling back to heuristics: {e}")
-        
-        # Use heuristic parsers for reliable extraction
-        fragments.extend(self._extract_json_fragments(text))
-        fragments.extend(self._extract_html_fragments(text))
-        fragments.extend(self._extract_csv_fragments(text))
-        fragments.extend(self._extract_xml_fragments(text))
-        
+
         # Deduplicate and sort by position
         fragments = self._deduplicate_fragments(fragments)
-        
+
         return fragments
-    
+
+    @staticmethod
+    def _heuristic_confident(text: str) -> bool:
+        """Whether sentinel counts alone make SLM detection redundant.
+
+        str.count is a single C-level scan; a text with plenty of braces,
+        tags, or commas will be handled by the heuristic extractors anyway.
+        """
+        return text.count('{') + text.count('<') + text.count(',') >= 10
+
     def _extract_json_fragments(self, text: str) -> List[Dict[str, Any]]:
-        """Extract JSON fragments using heuristic parsing."""
+        """Extract JSON fragments by sweeping the text with the C-level JSON decoder.
+
+        Instead of counting braces character-by-character in Python (which is slow
+        and miscounts braces inside strings), we jump to each candidate '{'/'['
+        and let json.JSONDecoder.raw_decode find the end of the value for us.
+        """
         fragments = []
-        lines = text.split('\n')
-        
-        # Find JSON objects and arrays
-        in_json = False
-        json_start = -1
-        brace_count = 0
-        bracket_count = 0
-        current_json = []
-        
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            
-            # Count braces and brackets
-            for char in stripped:
-                if char == '{':
-                    if not in_json:
-                        in_json = True
-                        json_start = i
-                        current_json = []
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                elif char == '[':
-                    if not in_json and stripped.startswith('['):
-                        in_json = True
-                        json_start = i
-                        current_json = []
-                    bracket_count += 1
-                elif char == ']':
-                    bracket_count -= 1
-            
-            if in_json:
-                current_json.append(line)
-                
-                # Check if JSON is complete
-                if brace_count == 0 and bracket_count == 0:
-                    json_text = '\n'.join(current_json)
-                    try:
-                        # Validate JSON
-                        parsed = json.loads(json_text)
-                        fragments.append({
-                            "type": "json",
-                            "start_line": json_start + 1,
-                            "end_line": i + 1,
-                            "content": json_text,
-                            "parsed_data": parsed
-                        })
-                    except json.JSONDecodeError:
-                        # Try to fix common issues
-                        try:
-                            # Remove trailing commas
-                            fixed_json = re.sub(r',\s*(}|])', r'\1', json_text)
-                            parsed = json.loads(fixed_json)
-                            fragments.append({
-                                "type": "json",
-                                "start_line": json_start + 1,
-                                "end_line": i + 1,
-                                "content": fixed_json,
-                                "parsed_data": parsed,
-                                "note": "malformed_fixed"
-                            })
-                        except:
-                            pass
-                    
-                    in_json = False
-                    json_start = -1
-                    current_json = []
-        
+        decoder = json.JSONDecoder()
+        i = 0
+        n = len(text)
+
+        while i < n:
+            # Find the next candidate JSON start
+            brace = text.find('{', i)
+            bracket = text.find('[', i)
+            if brace == -1:
+                start = bracket
+            elif bracket == -1:
+                start = brace
+            else:
+                start = min(brace, bracket)
+            if start == -1:
+                break
+
+            # Cheap prefilter before launching the decoder: an object with
+            # content must have a quoted key shortly after the brace, so
+            # brace-heavy non-JSON (code blocks, prose) is rejected with a
+            # single C-level scan instead of a parser start-up per brace.
+            if text[start] == '{':
+                window = text[start:start + 256]
+                if '"' not in window and '}' not in window:
+                    i = start + 1
+                    continue
+
+            try:
+                parsed, end = decoder.raw_decode(text, start)
+                fragments.append({
+                    "type": "json",
+                    "start_line": text.count('\n', 0, start) + 1,
+                    "end_line": text.count('\n', 0, end) + 1,
+                    "content": text[start:end],
+                    "parsed_data": parsed
+                })
+                i = end
+            except json.JSONDecodeError:
+                # Try to fix common issues (e.g. trailing commas) on the
+                # failing region only, not the whole document
+                window = text[start:start + 10000]
+                fixed_json = _TRAILING_COMMA_RE.sub(r'\1', window)
+                try:
+                    parsed, fixed_end = decoder.raw_decode(fixed_json)
+                    fragments.append({
+                        "type": "json",
+                        "start_line": text.count('\n', 0, start) + 1,
+                        "end_line": text.count('\n', 0, start + fixed_end) + 1,
+                        "content": fixed_json[:fixed_end],
+                        "parsed_data": parsed,
+                        "note": "malformed_fixed"
+                    })
+                    # Conservative advance: the original region is at least
+                    # as long as the fixed one
+                    i = start + fixed_end
+                except json.JSONDecodeError:
+                    i = start + 1
+
         return fragments
         
-    def _extract_html_fragments(self, text: str) -> List[Dict[str, Any]]:
-        """Extract HTML fragments using BeautifulSoup."""
+    def _extract_html_fragments(self, text: str, lines: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Extract HTML fragments and parse their tables with lxml."""
         fragments = []
-        lines = text.split('\n')
-        
-        html_pattern = re.compile(r'<[^>]+>')
+        if lines is None:
+            lines = text.split('\n')
+
         in_html = False
         html_start = -1
         current_html = []
         
         for i, line in enumerate(lines):
-            if html_pattern.search(line):
+            if _HTML_TAG_RE.search(line):
                 if not in_html:
                     in_html = True
                     html_start = i
@@ -139,9 +218,9 @@ class DataExtractor:
             elif in_html:
                 html_text = '\n'.join(current_html)
                 try:
-                    soup = BeautifulSoup(html_text, 'html.parser')
+                    tree = lxml_html.fromstring(html_text, parser=_html_parser())
                     # --- MODIFICATION: Parse tables returns List[Dict] (rows) ---
-                    parsed_rows = self._parse_html_tables(soup)
+                    parsed_rows = self._parse_html_tables(tree)
                     if parsed_rows:
                         fragments.append({
                             "type": "html",
@@ -160,8 +239,8 @@ class DataExtractor:
         if in_html and current_html:
             html_text = '\n'.join(current_html)
             try:
-                soup = BeautifulSoup(html_text, 'html.parser')
-                parsed_rows = self._parse_html_tables(soup)
+                tree = lxml_html.fromstring(html_text, parser=_html_parser())
+                parsed_rows = self._parse_html_tables(tree)
                 if parsed_rows:
                     fragments.append({
                         "type": "html",
@@ -176,40 +255,42 @@ class DataExtractor:
         return fragments
 
     # --- THIS FUNCTION IS COMPLETELY REWRITTEN ---
-    def _parse_html_tables(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    def _parse_html_tables(self, tree: etree.Element) -> List[Dict[str, Any]]:
         """
         Extract structured data from HTML tables into a list of row dictionaries.
-        Each table's rows are added to the list.
+        Each table's rows are added to the list. All traversal happens through
+        lxml XPath, which runs in C rather than Python-level tree walking.
         """
         all_rows_data = []
-        tables = soup.find_all('table')
-        
-        for table in tables:
+
+        # descendant-or-self: fromstring returns the table itself when the
+        # fragment is a bare table
+        for table in tree.xpath('descendant-or-self::table'):
             headers = []
-            
+
             # Find headers: Check <thead> first
-            thead = table.find('thead')
-            if thead:
-                header_row = thead.find('tr')
-                if header_row:
-                    headers = [th.get_text(strip=True) for th in header_row.find_all(['th', 'td'])]
-            
+            header_rows = table.xpath('.//thead//tr')
+            if header_rows:
+                headers = [cell.text_content().strip()
+                           for cell in header_rows[0].xpath('.//th|.//td')]
+
             # Find body rows
-            tbody = table.find('tbody') or table
-            
+            tbody = table.xpath('.//tbody')
+            scope = tbody[0] if tbody else table
+
             # If no headers in <thead>, try finding <th> in the first row of <tbody>
             if not headers:
-                first_row = tbody.find('tr')
-                if first_row and first_row.find('th'):
-                    headers = [th.get_text(strip=True) for th in first_row.find_all('th')]
+                rows = scope.xpath('.//tr')
+                if rows and rows[0].xpath('.//th'):
+                    headers = [th.text_content().strip() for th in rows[0].xpath('.//th')]
                     # Get all rows *after* this header row
-                    data_rows = first_row.find_next_siblings('tr')
+                    data_rows = rows[0].xpath('following-sibling::tr')
                 else:
                     # No headers found, can't parse as dict
                     data_rows = []
             else:
                 # Headers were in <thead>, get all rows from <tbody>
-                data_rows = tbody.find_all('tr')
+                data_rows = scope.xpath('.//tr')
 
             if not headers:
                 logger.warning("Skipping table, no headers (<th>) found.")
@@ -223,11 +304,11 @@ class DataExtractor:
             except ImportError:
                 # Fallback if cleaner isn't available
                 clean_headers = [h.lower().replace(' ', '_') for h in headers]
-            
+
             # Extract data
             for tr in data_rows:
-                cells = [td.get_text(strip=True) for td in tr.find_all(['td'])]
-                
+                cells = [td.text_content().strip() for td in tr.xpath('.//td')]
+
                 # Ensure cell count matches header count
                 if len(cells) == len(clean_headers):
                     row_dict = dict(zip(clean_headers, cells))
@@ -237,16 +318,31 @@ class DataExtractor:
 
         return all_rows_data
     
-    def _extract_csv_fragments(self, text: str) -> List[Dict[str, Any]]:
+    def _extract_csv_fragments(self, text: str, lines: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """Extract CSV fragments using heuristic detection."""
         fragments = []
-        lines = text.split('\n')
-        
+        if lines is None:
+            lines = text.split('\n')
+
+        # Specialize the candidate set per file: count each delimiter once
+        # over the head of the text (a C-level scan) and test only the ones
+        # that occur, dominant first. Most files use a single delimiter, so
+        # the per-line detection below usually checks exactly one.
+        sample = text[:65536]
+        candidates = tuple(sorted(
+            (d for d in _CSV_DELIMS if d in sample),
+            key=sample.count, reverse=True
+        ))
+        if not candidates:
+            # Delimiters may appear only past the sampled head; keep the
+            # full candidate list rather than miss them
+            candidates = _CSV_DELIMS
+
         in_csv = False
         csv_start = -1
         current_csv = []
         delimiter = ','
-        
+
         for i, line in enumerate(lines):
             stripped = line.strip()
             
@@ -270,10 +366,12 @@ class DataExtractor:
                     current_csv = []
                 continue
             
-            # Detect CSV by checking for consistent delimiters
+            # Detect CSV by checking for consistent delimiters. A membership
+            # test is equivalent to len(split) >= 2 without allocating the
+            # field list for every line/delimiter pair.
             if not in_csv and stripped:
-                for delim in [',', ';', '\t', '|']:
-                    if delim in stripped and len(stripped.split(delim)) >= 2:
+                for delim in candidates:
+                    if delim in stripped:
                         # Check if it looks like CSV (not JSON or simple text)
                         if ':' not in stripped or delim != ',':
                             in_csv = True
@@ -283,7 +381,7 @@ class DataExtractor:
                             break
             elif in_csv:
                 # Check if line continues CSV pattern
-                if (delimiter in stripped and len(stripped.split(delimiter)) >= 2) or stripped == '':
+                if delimiter in stripped or stripped == '':
                     current_csv.append(line)
                 else:
                     # End of CSV
@@ -322,10 +420,24 @@ class DataExtractor:
     def _parse_csv(self, csv_text: str, delimiter: str = ',') -> List[Dict[str, Any]]:
         """Parse CSV text to structured data."""
         try:
-            reader = csv.DictReader(io.StringIO(csv_text), delimiter=delimiter)
-            return [row for row in reader]
-        except Exception as e:
-            logger.warning(f"Error parsing CSV: {e}")
+            # pandas' C engine tokenizes the whole block in one vectorized
+            # pass; dtype=str keeps values as strings (type inference is the
+            # cleaner's job) and keep_default_na leaves empty cells as ''
+            df = pd.read_csv(
+                io.StringIO(csv_text),
+                sep=delimiter,
+                dtype=str,
+                keep_default_na=False
+            )
+            return df.to_dict('records')
+        except Exception:
+            # Fall back to the stdlib reader for blocks the C engine rejects
+            # (e.g. ragged rows)
+            try:
+                reader = csv.DictReader(io.StringIO(csv_text), delimiter=delimiter)
+                return [row for row in reader]
+            except Exception as e:
+                logger.warning(f"Error parsing CSV: {e}")
             # Try without headers
             try:
                 reader = csv.reader(io.StringIO(csv_text), delimiter=delimiter)
@@ -339,78 +451,115 @@ class DataExtractor:
 
     # --- XML EXTRACTION LOGIC ---
     def _xml_to_dict(self, element: etree.Element) -> Dict[str, Any]:
-        """Recursively converts an lxml Element to a dictionary."""
-        d = dict(element.attrib)
-        
-        # Get text content if no children
-        text = (element.text or '').strip()
-        if text:
-            d['text_content'] = text
-
-        for child in element:
-            child_tag = child.tag
-            child_dict = self._xml_to_dict(child)
-            
-            # Handle list of children with the same tag (e.g., multiple <supplier> tags)
-            if child_tag in d:
-                if isinstance(d[child_tag], list):
-                    d[child_tag].append(child_dict)
+        """Converts an lxml Element to a dictionary with an explicit stack.
+
+        The subtree is folded bottom-up in reverse DFS order, so children
+        are converted before their parent without paying one Python frame
+        per nesting level.
+        """
+        order = [element]
+        stack = [element]
+        while stack:
+            children = list(stack.pop())
+            order.extend(children)
+            stack.extend(children)
+
+        converted = {}
+        for el in reversed(order):
+            d = dict(el.attrib)
+
+            # Get text content if no children
+            text = (el.text or '').strip()
+            if text:
+                d['text_content'] = text
+
+            for child in el:
+                child_tag = child.tag
+                child_dict = converted.pop(child)
+
+                # Handle list of children with the same tag (e.g., multiple <supplier> tags)
+                if child_tag in d:
+                    if isinstance(d[child_tag], list):
+                        d[child_tag].append(child_dict)
+                    else:
+                        d[child_tag] = [d[child_tag], child_dict]
                 else:
-                    d[child_tag] = [d[child_tag], child_dict]
+                    d[child_tag] = child_dict
+
+            # If the element has children and attributes, combine them with the tag name as a key
+            if el.attrib or len(el):
+                # If it's a list item (like a supplier), return the contents directly
+                if not d.get('text_content'):
+                    d.pop('text_content', None)
+                converted[el] = d
             else:
-                d[child_tag] = child_dict
-        
-        # If the element has children and attributes, combine them with the tag name as a key
-        if element.attrib or list(element):
-            # If it's a list item (like a supplier), return the contents directly
-            if not d.get('text_content'):
-                del d['text_content']
-            return d
-        
-        # If only text content, return text content directly (for leaf nodes)
-        return text if text else d
+                # If only text content, return text content directly (for leaf nodes)
+                converted[el] = text if text else d
+
+        return converted[element]
 
     def _extract_xml_fragments(self, text: str) -> List[Dict[str, Any]]:
         """Extract XML fragments using lxml and convert to flat records."""
         fragments = []
         lines = text.split('\n')
         
-        # Regex to find XML-like structures (starting with '<?xml' or a root tag)
-        xml_pattern = re.compile(r'(<\?xml.*?\?>)?\s*<[a-zA-Z_][^>]*>.*?</[a-zA-Z_][^>]*>', re.DOTALL)
-        
-        for match in xml_pattern.finditer(text):
+        # Index newline offsets once so each match's line numbers are a
+        # binary search instead of an O(offset) count over a text prefix
+        newline_offsets = []
+        pos = text.find('\n')
+        while pos != -1:
+            newline_offsets.append(pos)
+            pos = text.find('\n', pos + 1)
+
+        for match in _XML_DOC_RE.finditer(text):
             xml_text = match.group(0).strip()
-            
+
             # Determine line numbers (simple heuristic based on char index)
             start_index = match.start()
             end_index = match.end()
-            start_line = text[:start_index].count('\n') + 1
-            end_line = text[:end_index].count('\n') + 1
+            start_line = bisect.bisect_left(newline_offsets, start_index) + 1
+            end_line = bisect.bisect_left(newline_offsets, end_index) + 1
             
             try:
-                # 1. Parse the XML
-                parser = etree.XMLParser(recover=True, encoding='utf-8')
-                root = etree.fromstring(xml_text.encode('utf-8'), parser=parser)
-                
-                # 2. Convert to list of flat records. We assume the children of the
-                #    root element are the logical records.
+                # 1. Stream-parse the XML region. iterparse emits each child
+                #    of the root as its subtree completes, so we convert and
+                #    release records one at a time instead of materializing
+                #    the whole tree and walking it afterwards.
                 records = []
-                # Use the root tag name to name the collection of records
-                collection_tag = root.tag
-                
-                # Check if the root has relevant children (the actual records)
-                if len(root) > 0:
-                    for element in root:
-                        # Convert each child element into a single flat record dictionary
-                        record_dict = self._xml_to_dict(element)
-                        
+                root = None
+                for event, element in etree.iterparse(
+                    io.BytesIO(xml_text.encode('utf-8')),
+                    events=('start', 'end'),
+                    recover=True
+                ):
+                    if event == 'start':
+                        # First start event is the root element; its attributes
+                        # are available before any child completes
+                        if root is None:
+                            root = element
+                            # HTML regions are handled by the HTML extractor;
+                            # don't double-extract them as junk XML records
+                            if isinstance(root.tag, str) and root.tag.lower() in _HTML_ROOT_TAGS:
+                                records = []
+                                break
+                        continue
+                    if root is None or element.getparent() is not root:
+                        continue
+
+                    # Convert each child element into a single flat record dictionary
+                    record_dict = self._xml_to_dict(element)
+                    if isinstance(record_dict, dict):
                         # Add attributes of the root element to all records (optional, but useful)
                         for attr, val in root.attrib.items():
                             record_dict[f'root_attr_{attr}'] = val
-                            
+
                         # Flatten the nested dictionary if possible
-                        flat_record = self._flatten_dict(record_dict)
-                        records.append(flat_record)
+                        records.append(self._flatten_dict(record_dict))
+
+                    # Release the converted subtree to keep memory bounded
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del root[0]
                 
                 if records:
                     fragments.append({
@@ -430,41 +579,49 @@ class DataExtractor:
         return fragments
 
     def _flatten_dict(self, d: Dict[str, Any], parent_key: str = '', sep: str = '_') -> Dict[str, Any]:
-        """Flattens a nested dictionary, which helps with the XML-to-JSON conversion."""
+        """Flattens a nested dictionary, which helps with the XML-to-JSON conversion.
+
+        Uses an explicit work stack instead of recursing per nesting level.
+        """
         items = {}
-        for k, v in d.items():
-            new_key = parent_key + sep + k if parent_key else k
-            if isinstance(v, dict):
-                # We stop flattening if a nested dictionary contains a list, 
-                # as that represents an array/sub-document which MongoDB handles well.
-                has_list_child = any(isinstance(val, list) for val in v.values())
-                if has_list_child:
-                    items[new_key] = v
+        stack = [(d, parent_key)]
+        while stack:
+            current, prefix = stack.pop()
+            for k, v in current.items():
+                new_key = prefix + sep + k if prefix else k
+                if isinstance(v, dict):
+                    # We stop flattening if a nested dictionary contains a list,
+                    # as that represents an array/sub-document which MongoDB handles well.
+                    has_list_child = any(isinstance(val, list) for val in v.values())
+                    if has_list_child:
+                        items[new_key] = v
+                    else:
+                        stack.append((v, new_key))
                 else:
-                    items.update(self._flatten_dict(v, new_key, sep=sep))
-            elif isinstance(v, list):
-                # Keep lists as they are (representing multiple elements/sub-records)
-                items[new_key] = v
-            else:
-                items[new_key] = v
+                    # Lists and scalars are kept as they are
+                    items[new_key] = v
         return items
     
     def _deduplicate_fragments(self, fragments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Remove duplicate or overlapping fragments."""
         if not fragments:
             return []
-        
-        # Sort by start line
-        fragments.sort(key=lambda x: x['start_line'])
-        
-        # Remove duplicates based on type and line range
-        seen = set()
+
+        # Sort by position, widest-first at equal starts, so a duplicate of
+        # the same type always follows the fragment that covers it
+        fragments.sort(key=lambda x: (x['start_line'], -x['end_line']))
+
+        # Single interval sweep: track the last kept line range per type and
+        # drop fragments of that type falling inside it. This subsumes the
+        # old exact (type, start, end) set without building keys per fragment.
+        last_kept = {}
         unique_fragments = []
-        
+
         for frag in fragments:
-            key = (frag['type'], frag['start_line'], frag['end_line'])
-            if key not in seen:
-                seen.add(key)
-                unique_fragments.append(frag)
-        
+            interval = last_kept.get(frag['type'])
+            if interval and interval[0] <= frag['start_line'] and frag['end_line'] <= interval[1]:
+                continue
+            last_kept[frag['type']] = (frag['start_line'], frag['end_line'])
+            unique_fragments.append(frag)
+
         return unique_fragments
\ No newline at end of file
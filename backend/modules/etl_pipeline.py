@@ -1,4 +1,5 @@
 """Main ETL pipeline orchestrator."""
+import asyncio
 import logging
 import os
 from pathlib import Path
@@ -44,6 +45,12 @@ class ETLPipeline:
             # Step 2: Extract fragments
             fragments = self.data_extractor.extract_all_fragments(content, source_id)
             logger.info(f"Extracted {len(fragments)} fragments")
+
+            # The extractors need the whole document for cross-line region
+            # detection, but nothing downstream does: release the text here
+            # so peak memory for the rest of the pipeline is bounded by the
+            # fragments rather than the file
+            del content
             
             if not fragments:
                 return {
@@ -68,6 +75,11 @@ class ETLPipeline:
                     cleaned = self.data_cleaner.clean_records(records)
                     all_records.extend(cleaned)
                     fragment['cleaned_records'] = cleaned
+                    # Everything downstream (schema, load, summary) works off
+                    # cleaned_records; drop the raw fragment text and the
+                    # uncleaned parse so large fragments aren't held twice
+                    fragment.pop('parsed_data', None)
+                fragment.pop('content', None)
             
             logger.info(f"Cleaned {len(all_records)} total records")
             
@@ -114,29 +126,44 @@ class ETLPipeline:
     
     async def _load_data(self, source_id: str, fragments: List[Dict[str, Any]]):
         """Load cleaned data into database collections."""
+        # One timestamp for the whole upload (all records belong to the same
+        # event anyway), and one bucket per target collection so multiple
+        # fragments of the same type share a single insert_many round-trip
+        now_iso = datetime.now(timezone.utc).isoformat()
+        buckets: Dict[str, List[Dict[str, Any]]] = {}
         for fragment in fragments:
-            frag_type = fragment['type']
             cleaned_records = fragment.get('cleaned_records', [])
-            
             if not cleaned_records:
                 continue
-            
-            # Create collection name
-            collection_name = f"{frag_type}_data"
-            collection = self.db[collection_name]
-            
-            # Create copies of records to avoid modifying originals
-            records_to_insert = []
+
+            collection_name = f"{fragment['type']}_data"
+            bucket = buckets.setdefault(collection_name, [])
+            # Copy records so the originals (still referenced by the upload
+            # summary) are not polluted with metadata fields
             for record in cleaned_records:
-                record_copy = record.copy()
-                record_copy['_source_id'] = source_id
-                record_copy['_uploaded_at'] = datetime.now(timezone.utc).isoformat()
-                records_to_insert.append(record_copy)
-            
-            # Insert records
-            if records_to_insert:
-                await collection.insert_many(records_to_insert)
-                logger.info(f"Loaded {len(records_to_insert)} records into {collection_name}")
+                bucket.append({**record, '_source_id': source_id, '_uploaded_at': now_iso})
+
+        if not buckets:
+            return
+
+        # Every read path filters data collections on _source_id (records
+        # endpoint, per-source queries); make sure that index exists so those
+        # reads never degrade to collection scans as data accumulates.
+        # create_index is a no-op when the index is already there.
+        await asyncio.gather(*(
+            self.db[name].create_index('_source_id')
+            for name in buckets
+        ))
+
+        # Insert batches concurrently. ordered=False lets the server apply
+        # each batch in parallel instead of serializing on document order;
+        # records are freshly cleaned so there are no pre-checks to preserve.
+        await asyncio.gather(*(
+            self.db[name].insert_many(records, ordered=False)
+            for name, records in buckets.items()
+        ))
+        for name, records in buckets.items():
+            logger.info(f"Loaded {len(records)} records into {name}")
     
     async def _log_upload(self, source_id: str, file_path: str, file_type: str, 
                          fragments: List[Dict[str, Any]], record_count: int):
@@ -153,10 +180,24 @@ class ETLPipeline:
         
         await self.uploads_collection.insert_one(log_entry)
     
-    async def get_upload_history(self, source_id: str) -> List[Dict[str, Any]]:
-        """Get upload history for a source."""
+    async def ensure_indexes(self):
+        """Create indexes backing the history queries (no-op if present).
+
+        The compound index serves both the source_id filter and the
+        timestamp sort, so history reads never fall back to a collection
+        scan plus in-memory sort.
+        """
+        await self.uploads_collection.create_index([("source_id", 1), ("timestamp", -1)])
+
+    async def get_upload_history(self, source_id: str, limit: int = 100,
+                                 offset: int = 0) -> List[Dict[str, Any]]:
+        """Get upload history for a source, newest first.
+
+        skip/limit ride the (source_id, timestamp) index, so only the
+        requested page is scanned and shipped.
+        """
         uploads = await self.uploads_collection.find(
             {"source_id": source_id},
             {"_id": 0}
-        ).sort("timestamp", -1).to_list(100)
+        ).sort("timestamp", -1).skip(offset).limit(limit).to_list(limit)
         return uploads
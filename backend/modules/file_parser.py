@@ -1,8 +1,9 @@
 """File parser for extracting content from different file formats."""
+import io
 import logging
 from pathlib import Path
 from typing import Tuple
-import PyPDF2
+import pypdf
 
 logger = logging.getLogger(__name__)
 
@@ -32,26 +33,35 @@ class FileParser:
     @staticmethod
     def _parse_text(file_path: str) -> str:
         """Parse text or markdown file."""
+        # Read the raw bytes once with a large buffer (fewer syscalls on big
+        # files) and decode in memory; a decode failure then falls back to
+        # latin-1 without re-reading the file from disk
+        with open(file_path, 'rb', buffering=1 << 22) as f:
+            raw = f.read()
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            return raw.decode('utf-8')
         except UnicodeDecodeError:
             # Try with different encodings
-            with open(file_path, 'r', encoding='latin-1') as f:
-                return f.read()
+            return raw.decode('latin-1')
     
     @staticmethod
     def _parse_pdf(file_path: str) -> str:
         """Parse PDF file and extract text."""
         try:
-            content = []
+            # Stream page text into one buffer instead of keeping a list of
+            # page strings plus the final join copy
+            buf = io.StringIO()
             with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
+                pdf_reader = pypdf.PdfReader(f)
+                first = True
                 for page in pdf_reader.pages:
                     text = page.extract_text()
                     if text:
-                        content.append(text)
-            return '\n'.join(content)
+                        if not first:
+                            buf.write('\n')
+                        buf.write(text)
+                        first = False
+            return buf.getvalue()
         except Exception as e:
             logger.error(f"Error parsing PDF: {e}")
             raise
@@ -1,29 +1,175 @@
 """Ollama client for LLM and SLM operations."""
+import asyncio
 import ollama
-import json
+import orjson
 import logging
+import os
+import re
 from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# Static system prompts, hoisted to module level and kept byte-identical
+# across calls: Ollama reuses its KV-cache for a byte-stable prompt prefix
+# on a long-lived client session, so all per-request content (schema, text,
+# question) must live in the user message only.
+_DETECT_SYSTEM_PROMPT = """You are a data type detector. Analyze the given text and identify segments that contain HTML, JSON, or CSV data.
+Return a JSON object with this structure:
+{
+  "fragments": [
+    {"type": "html"|"json"|"csv", "start_line": number, "end_line": number, "content": "snippet"},
+    ...
+  ]
+}
+Be precise with line numbers and data type identification."""
+
+# Added stricter rules to prevent the LLM from
+# querying the schema structure itself.
+_NL_TO_QUERY_SYSTEM_PROMPT = """You are a MongoDB query expert. Your task is to convert a user's natural language question into a valid MongoDB query, based on a provided schema.
+
+You MUST adhere to the following rules:
+1.  Return **ONLY** a single, valid, RFC 8259-compliant JSON object.
+2.  All keys and all string values **MUST** be enclosed in **double quotes**.
+3.  Do not include any explanations, markdown (like ```json), or any text outside of the JSON object.
+4.  Use the provided schema to determine field names and data types.
+5.  **CRITICAL**: The schema describes the data. Do NOT query the schema keys. Query the *fields* directly.
+    -   **Query:** "show me products with price > 100"
+    -   **SCHEMA CONTAINS:** `{"collections": {"json_data": {"fields": {"price": ...}}}}`
+    -   **BAD (WRONG):** `{"filter": {"collections.json_data.price": {"$gt": 100}}}`
+    -   **GOOD (CORRECT):** `{"filter": {"price": {"$gt": 100}}}`
+6.  For simple comparisons (e.g., greater than, less than, equals), use standard MongoDB query operators, **NOT** `$expr`.
+    -   **GOOD:** `{"filter": {"price": {"$gt": 100}}}`
+    -   **BAD:** `{"filter": {"$expr": {"$gt": ["$price", 100]}}}`
+7.  For "aggregate" operations, use:
+    `{"operation": "aggregate", "pipeline": [...]}`
+8.  Always include `"projection": {"_id": 0}` in "find" operations.
+"""
+
+# Fast-path templates for trivial questions: a successful match turns a
+# multi-second model round-trip into a microsecond regex. Patterns are kept
+# deliberately narrow (anchored, numeric comparisons only) so anything
+# ambiguous still goes to the model.
+_SHOW_ALL_RE = re.compile(
+    r'(?i)^\s*(?:show|list|get|display)\s+(?:me\s+)?(?:all\s+)?(?:the\s+)?\w+\s*$')
+_FILTER_RE = re.compile(
+    r'(?i)^\s*(?:show|list|get|find|display)\s+(?:me\s+)?(?:all\s+)?(?:the\s+)?\w+\s+'
+    r'(?:where|with)\s+(\w+)\s*(>=|<=|==|>|<|=)\s*(-?\d+(?:\.\d+)?)\s*$')
+_COMPARISON_OPS = {'>': '$gt', '<': '$lt', '>=': '$gte', '<=': '$lte', '=': '$eq', '==': '$eq'}
+
+def _template_query(natural_language: str, schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Build a Mongo query for template questions, or None to use the model."""
+    if _SHOW_ALL_RE.match(natural_language):
+        return {"operation": "find", "filter": {}, "projection": {"_id": 0}}
+
+    match = _FILTER_RE.match(natural_language)
+    if match:
+        field, op, number = match.groups()
+        # Only trust the template when the field actually exists somewhere
+        # in the schema; otherwise let the model interpret the question
+        known_fields = {
+            name
+            for coll in schema.get('collections', {}).values()
+            for name in coll.get('fields', {})
+        }
+        if field in known_fields:
+            value = float(number) if '.' in number else int(number)
+            return {
+                "operation": "find",
+                "filter": {field: {_COMPARISON_OPS[op]: value}},
+                "projection": {"_id": 0}
+            }
+    return None
+
+# Decoding caps for the translation task: the answer is one small JSON
+# object, so bound generation length and decode greedily instead of letting
+# the model free-run to its context limit
+_TRANSLATE_OPTIONS = {"temperature": 0, "top_k": 1, "num_predict": 256}
+
+# Shared per-model clients: the extractor, query executor, and pipeline each
+# need one, and sharing an instance also shares its caches
+_clients: Dict[str, "OllamaClient"] = {}
+
+def get_client(model: Optional[str] = None) -> "OllamaClient":
+    """Return the process-wide OllamaClient for a model.
+
+    The default model can be overridden with OLLAMA_MODEL, e.g. to route
+    the short constrained-JSON workloads to a smaller quantized model
+    without touching code.
+    """
+    if model is None:
+        model = os.environ.get('OLLAMA_MODEL', 'llama3:8b')
+    client = _clients.get(model)
+    if client is None:
+        client = _clients[model] = OllamaClient(model)
+    return client
+
 class OllamaClient:
     """Client for interacting with Ollama models."""
     
     def __init__(self, model: str = "llama3:8b"):
         self.model = model
-        self.client = ollama
-        
-    def generate(self, prompt: str, system: Optional[str] = None) -> str:
-        """Generate text using Ollama model."""
+        # Async client for the query path: translate_nl_to_query runs on the
+        # event loop and must not block it for a whole model forward pass.
+        # The sync module API stays for the extractor, whose SLM probe runs
+        # in a worker thread where blocking is fine.
+        self.client = ollama.AsyncClient()
+        self._sync_client = ollama
+        # Responses are treated as deterministic per (model, prompt), so
+        # memoize the two public entry points by input hash; re-uploads and
+        # repeated questions otherwise pay a full model round-trip
+        self._extract_cache: Dict[int, Dict[str, Any]] = {}
+        self._translate_cache: Dict[int, str] = {}
+        # In-flight translations by cache key: concurrent identical
+        # questions (dashboard refreshes, retries) await one model call
+        # instead of each launching their own
+        self._in_flight: Dict[int, "asyncio.Future[str]"] = {}
+
+    # format='json' makes the server constrain decoding to valid JSON, so
+    # callers get RFC 8259 output directly instead of scraping it out of
+    # markdown fences; temperature 0 keeps responses deterministic, which
+    # also raises the hit rate of the exact-match caches
+    _JSON_OPTIONS = {"temperature": 0}
+
+    async def generate(self, prompt: str, system: Optional[str] = None,
+                       format: Optional[str] = None,
+                       options: Optional[Dict[str, Any]] = None) -> str:
+        """Generate text using the Ollama model without blocking the event loop."""
+        try:
+            messages = []
+            if system:
+                messages.append({"role": "system", "content": system})
+            messages.append({"role": "user", "content": prompt})
+
+            if options is None and format == 'json':
+                options = self._JSON_OPTIONS
+            response = await self.client.chat(
+                model=self.model,
+                messages=messages,
+                format=format,
+                options=options
+            )
+            return response['message']['content']
+        except Exception as e:
+            logger.error(f"Ollama generation error: {e}")
+            raise
+
+    def generate_sync(self, prompt: str, system: Optional[str] = None,
+                      format: Optional[str] = None,
+                      options: Optional[Dict[str, Any]] = None) -> str:
+        """Blocking variant of generate, for callers running in worker threads."""
         try:
             messages = []
             if system:
                 messages.append({"role": "system", "content": system})
             messages.append({"role": "user", "content": prompt})
-            
-            response = self.client.chat(
+
+            if options is None and format == 'json':
+                options = self._JSON_OPTIONS
+            response = self._sync_client.chat(
                 model=self.model,
-                messages=messages
+                messages=messages,
+                format=format,
+                options=options
             )
             return response['message']['content']
         except Exception as e:
@@ -32,67 +178,60 @@ class OllamaClient:
     
     def extract_structured_data(self, text: str) -> Dict[str, Any]:
         """Extract structured data types from text using SLM."""
-        system_prompt = """You are a data type detector. Analyze the given text and identify segments that contain HTML, JSON, or CSV data.
-Return a JSON object with this structure:
-{
-  "fragments": [
-    {"type": "html"|"json"|"csv", "start_line": number, "end_line": number, "content": "snippet"},
-    ...
-  ]
-}
-Be precise with line numbers and data type identification."""
-        
+        cache_key = hash(text)
+        cached = self._extract_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         user_prompt = f"""Analyze this text and identify all HTML, JSON, and CSV fragments:
 
 {text}
 
 Return only valid JSON."""
-        
+
         try:
-            response = self.generate(user_prompt, system_prompt)
-            # Clean response to extract JSON
-            response = response.strip()
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                response = response.split("```")[1].split("```")[0].strip()
-            
-            return json.loads(response)
-        except json.JSONDecodeError:
+            response = self.generate_sync(user_prompt, _DETECT_SYSTEM_PROMPT, format='json')
+            result = orjson.loads(response)
+            # Only successful parses are cached; transient failures retry
+            if len(self._extract_cache) >= 512:
+                self._extract_cache.clear()
+            self._extract_cache[cache_key] = result
+            return result
+        except orjson.JSONDecodeError:
             logger.warning("SLM returned invalid JSON, using fallback")
             return {"fragments": []}
         except Exception as e:
             logger.error(f"Error extracting structured data: {e}")
             return {"fragments": []}
     
-    def translate_nl_to_query(self, natural_language: str, schema: Dict[str, Any]) -> str:
+    async def translate_nl_to_query(self, natural_language: str, schema: Dict[str, Any]) -> str:
         """Translate natural language to MongoDB query."""
         
-        # --- MODIFIED PROMPT ---
-        # Added stricter rules to prevent the LLM from
-        # querying the schema structure itself.
-        system_prompt = """You are a MongoDB query expert. Your task is to convert a user's natural language question into a valid MongoDB query, based on a provided schema.
-        
-You MUST adhere to the following rules:
-1.  Return **ONLY** a single, valid, RFC 8259-compliant JSON object.
-2.  All keys and all string values **MUST** be enclosed in **double quotes**.
-3.  Do not include any explanations, markdown (like ```json), or any text outside of the JSON object.
-4.  Use the provided schema to determine field names and data types.
-5.  **CRITICAL**: The schema describes the data. Do NOT query the schema keys. Query the *fields* directly.
-    -   **Query:** "show me products with price > 100"
-    -   **SCHEMA CONTAINS:** `{"collections": {"json_data": {"fields": {"price": ...}}}}`
-    -   **BAD (WRONG):** `{"filter": {"collections.json_data.price": {"$gt": 100}}}`
-    -   **GOOD (CORRECT):** `{"filter": {"price": {"$gt": 100}}}`
-6.  For simple comparisons (e.g., greater than, less than, equals), use standard MongoDB query operators, **NOT** `$expr`.
-    -   **GOOD:** `{"filter": {"price": {"$gt": 100}}}`
-    -   **BAD:** `{"filter": {"$expr": {"$gt": ["$price", 100]}}}`
-7.  For "aggregate" operations, use:
-    `{"operation": "aggregate", "pipeline": [...]}`
-8.  Always include `"projection": {"_id": 0}` in "find" operations.
-"""
-        
+        # Template fast path: trivial questions never touch the model
+        template_query = _template_query(natural_language, schema)
+        if template_query is not None:
+            return orjson.dumps(template_query).decode()
+
+        schema_json = orjson.dumps(schema, option=orjson.OPT_INDENT_2).decode()
+        # Normalize the question for the cache key so trivial rephrasings
+        # (case, extra whitespace) of an already-answered question don't pay
+        # another model round-trip
+        normalized_nl = ' '.join(natural_language.lower().split())
+        cache_key = hash((normalized_nl, schema_json))
+        cached = self._translate_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Coalesce with an identical translation already in flight; this
+        # covers the window before the response cache is populated
+        in_flight = self._in_flight.get(cache_key)
+        if in_flight is not None:
+            return await in_flight
+        future: "asyncio.Future[str]" = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = future
+
         user_prompt = f"""Here is the schema:
-{json.dumps(schema, indent=2)}
+{schema_json}
 
 Here is the user's question:
 "{natural_language}"
@@ -102,22 +241,40 @@ Generate the MongoDB query JSON now.
         # --- END MODIFIED PROMPT ---
 
         try:
-            response = self.generate(user_prompt, system_prompt)
-            
-            # Clean response
+            response = await self.generate(user_prompt, _NL_TO_QUERY_SYSTEM_PROMPT,
+                                           format='json', options=_TRANSLATE_OPTIONS)
+
+            # format='json' guarantees a bare JSON value, so the old fence
+            # stripping and brace hunting are gone; just trim whitespace
             response = response.strip()
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                response = response.split("```")[1].split("```")[0].strip()
-            
-            # Force extract the JSON object
-            start = response.find('{')
-            end = response.rfind('}')
-            if start != -1 and end != -1:
-                response = response[start:end+1]
-            
+
+            # Only cache responses that parse; a truncated/invalid query
+            # cached here would be returned for every retry of the same
+            # question. Unparseable output still goes back to the caller,
+            # which surfaces the parse error, and the next attempt hits
+            # the model again.
+            try:
+                orjson.loads(response)
+            except orjson.JSONDecodeError:
+                logger.warning("SLM returned invalid query JSON, not caching")
+            else:
+                if len(self._translate_cache) >= 512:
+                    self._translate_cache.clear()
+                self._translate_cache[cache_key] = response
+            future.set_result(response)
             return response
         except Exception as e:
             logger.error(f"Error translating NL to query: {e}")
-            raise
\ No newline at end of file
+            future.set_exception(e)
+            # Mark the exception retrieved so a waiterless future doesn't
+            # log "exception was never retrieved" on collection
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(cache_key, None)
+            # If the leader was cancelled mid-generate (client disconnect),
+            # except Exception never ran and nothing resolved the future;
+            # cancel it so coalesced waiters are released instead of
+            # awaiting forever
+            if not future.done():
+                future.cancel()
\ No newline at end of file
@@ -1,38 +1,107 @@
 """Query executor for running MongoDB queries."""
+import asyncio
 import logging
-import json
+import orjson
 from typing import Dict, Any, List, Set
+from bson.codec_options import CodecOptions, TypeDecoder, TypeRegistry
 from bson.objectid import ObjectId
-from .ollama_client import OllamaClient
+from .ollama_client import get_client
 
 logger = logging.getLogger(__name__)
 
+class _ObjectIdToStr(TypeDecoder):
+    """Decode ObjectId straight to str inside pymongo's C decoder."""
+    bson_type = ObjectId
+
+    def transform_bson(self, value):
+        return str(value)
+
+# Collections read with these options yield JSON-ready documents directly,
+# replacing the old Python-level post-decode serialization walk
+_JSON_READY_CODEC = CodecOptions(type_registry=TypeRegistry([_ObjectIdToStr()]))
+
+# Cap on documents returned per collection per query
+_RESULT_LIMIT = 1000
+
+# Logical operators whose list operands contain nested filter documents
+_QUERY_OPERATORS = frozenset({'$or', '$and', '$nor'})
+
 class QueryExecutor:
     """Execute queries against MongoDB."""
     
     def __init__(self, db):
         self.db = db
-        self.ollama_client = OllamaClient()
-        self.queries_collection = db.queries
+        self.ollama_client = get_client()
+        self.queries_collection = db.get_collection('queries', codec_options=_JSON_READY_CODEC)
+        # Per-schema inverted field index and per-filter field extractions,
+        # keyed by their canonical JSON dumps. Schemas are stable between
+        # uploads and filters repeat across queries, so both caches hit
+        # constantly.
+        self._inverted_index_cache: Dict[bytes, Dict[str, frozenset]] = {}
+        self._query_fields_cache: Dict[bytes, Set[str]] = {}
+        # Query log entries are queued and flushed in the background so the
+        # response path doesn't wait on a Mongo round-trip per query. The
+        # flusher task starts lazily on first use: the executor is built at
+        # import time, before any event loop is running.
+        self._log_queue: asyncio.Queue = asyncio.Queue()
+        self._log_flusher_task = None
+
+    def _schema_inverted_index(self, schema: Dict[str, Any]) -> Dict[str, frozenset]:
+        """Field name -> collections containing it, cached by schema fingerprint.
+
+        Turns collection eligibility from O(collections x fields) set
+        construction per query into an O(filter fields) lookup.
+        """
+        fingerprint = orjson.dumps(schema, option=orjson.OPT_SORT_KEYS)
+        inverted = self._inverted_index_cache.get(fingerprint)
+        if inverted is None:
+            if len(self._inverted_index_cache) >= 32:
+                self._inverted_index_cache.clear()
+            index: Dict[str, set] = {}
+            for name, data in schema.get('collections', {}).items():
+                for field in data.get('fields', {}):
+                    index.setdefault(field, set()).add(name)
+            inverted = self._inverted_index_cache[fingerprint] = {
+                field: frozenset(names) for field, names in index.items()
+            }
+        return inverted
+
+    def _get_fields_cached(self, query_part: Dict[str, Any]) -> Set[str]:
+        """Memoized _get_fields_from_query for repeated filters/projections."""
+        try:
+            key = orjson.dumps(query_part, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # Non-JSON-serializable operand; fall back to a direct walk
+            return self._get_fields_from_query(query_part)
+        fields = self._query_fields_cache.get(key)
+        if fields is None:
+            if len(self._query_fields_cache) >= 256:
+                self._query_fields_cache.clear()
+            fields = self._query_fields_cache[key] = self._get_fields_from_query(query_part)
+        return fields
 
     def _get_fields_from_query(self, query_part: Dict[str, Any]) -> Set[str]:
-        """Recursively extract all field keys used in a filter or projection."""
+        """Extract all field keys used in a filter or projection.
+
+        Iterative stack walk instead of recursion; dotted paths like "a.b"
+        contribute their top-level field "a" so they match the schema's
+        field sets.
+        """
         fields = set()
-        for key, value in query_part.items():
-            if key.startswith('$'):
-                # Handle operators like $or, $and
-                if isinstance(value, list):
-                    for item in value:
-                        if isinstance(item, dict):
-                            fields.update(self._get_fields_from_query(item))
-            elif isinstance(value, dict):
-                # Handle nested queries like {"field": {"$gt": 10}}
-                # We only care about the top-level field name
-                fields.add(key)
-            else:
-                # Standard key: "field": "value" or in projection "field": 1
-                if key != "_id":
-                    fields.add(key)
+        stack = [query_part]
+        while stack:
+            for key, value in stack.pop().items():
+                if key.startswith('$'):
+                    # Operators like $or/$and nest further filter documents
+                    if key in _QUERY_OPERATORS and isinstance(value, list):
+                        stack.extend(item for item in value if isinstance(item, dict))
+                    continue
+                # For nested queries like {"field": {"$gt": 10}} only the
+                # top-level field name matters; _id exists everywhere and
+                # never narrows eligibility
+                field = key.split('.', 1)[0]
+                if field != '_id':
+                    fields.add(field)
         return fields
     
     async def execute_nl_query(self, source_id: str, natural_language: str, schema: Dict[str, Any]) -> Dict[str, Any]:
@@ -40,13 +109,13 @@ class QueryExecutor:
         query_json = None
         try:
             # Translate NL to MongoDB query
-            query_json = self.ollama_client.translate_nl_to_query(natural_language, schema)
+            query_json = await self.ollama_client.translate_nl_to_query(natural_language, schema)
             logger.info(f"Translated query: {query_json}")
             
             # --- FIX 1: Add graceful JSON parsing error handling ---
             try:
-                query_obj = json.loads(query_json)
-            except json.JSONDecodeError as json_err:
+                query_obj = orjson.loads(query_json)
+            except orjson.JSONDecodeError as json_err:
                 logger.error(f"LLM returned invalid JSON: {json_err}. Query: {query_json}")
                 raise ValueError(f"AI failed to generate valid JSON. Error: {json_err}")
             
@@ -82,7 +151,7 @@ class QueryExecutor:
         """Execute MongoDB query directly."""
         try:
             # Parse query
-            query_obj = json.loads(query_text)
+            query_obj = orjson.loads(query_text)
             
             # Execute query
             results = await self._execute_mongo_query(query_obj, schema)
@@ -110,30 +179,9 @@ class QueryExecutor:
                 }
             }
     
-    def _serialize_mongo_results(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Recursively convert ObjectId to str for JSON serialization."""
-        serialized_results = []
-        for record in results:
-            new_record = {}
-            for key, value in record.items():
-                if isinstance(value, ObjectId):
-                    new_record[key] = str(value)
-                elif isinstance(value, dict):
-                    # Recurse for nested dicts (if any)
-                    new_record[key] = self._serialize_mongo_results([value])[0]
-                elif isinstance(value, list):
-                    # Recurse for nested lists (if any)
-                    new_list = []
-                    for item in value:
-                        if isinstance(item, dict):
-                            new_list.append(self._serialize_mongo_results([item])[0])
-                        else:
-                            new_list.append(item)
-                    new_record[key] = new_list
-                else:
-                    new_record[key] = value
-            serialized_results.append(new_record)
-        return serialized_results
+    def _collection(self, name: str):
+        """Data collection configured to decode ObjectId as str."""
+        return self.db.get_collection(name, codec_options=_JSON_READY_CODEC)
 
     async def _execute_mongo_query(self, query_obj: Dict[str, Any], schema: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
@@ -153,50 +201,65 @@ class QueryExecutor:
             # --- FIX 2: "Smart Executor" Logic ---
             
             # 1. Get all fields used in the filter and projection
-            fields_in_filter = self._get_fields_from_query(filter_query)
-            fields_in_projection = self._get_fields_from_query(projection)
+            fields_in_filter = self._get_fields_cached(filter_query)
+            fields_in_projection = self._get_fields_cached(projection)
             
             logger.info(f"Fields in filter: {fields_in_filter}")
             logger.info(f"Fields in projection: {fields_in_projection}")
 
-            # 2. Iterate over collections and query only relevant ones
-            for collection_name, coll_data in collections_in_schema.items():
-                fields_in_this_collection = set(coll_data.get('fields', {}).keys())
-                
-                # Check 1: Do all FILTER fields exist in this collection?
-                # If a filter exists, all its fields must be in the collection.
-                if fields_in_filter and not fields_in_filter.issubset(fields_in_this_collection):
-                    logger.info(f"Skipping {collection_name}: missing filter fields.")
-                    continue
-                
-                # Check 2: If a projection exists, does this collection have AT LEAST ONE projected field?
-                # This prevents returning empty {} for collections that match the filter (e.g., {})
-                # but have none of the projected fields.
-                if fields_in_projection and not fields_in_projection.intersection(fields_in_this_collection):
-                    logger.info(f"Skipping {collection_name}: missing projection fields.")
-                    continue
-                
-                # If we pass both checks, query this collection
-                logger.info(f"Querying collection: {collection_name}")
-                collection = self.db[collection_name]
-                results = await collection.find(filter_query, projection).to_list(1000)
+            # 2. Select only relevant collections via the inverted index.
+            # Check 1: every FILTER field must exist in the collection, so
+            # intersect the per-field collection sets. Check 2: a projection
+            # must share AT LEAST ONE field with the collection (union), to
+            # avoid returning empty {} docs for collections that match an
+            # empty filter but have none of the projected fields.
+            inverted = self._schema_inverted_index(schema)
+            eligible_set = set(collections_in_schema)
+            for field in fields_in_filter:
+                eligible_set &= inverted.get(field, frozenset())
+            if fields_in_projection:
+                projected = set()
+                for field in fields_in_projection:
+                    projected |= inverted.get(field, frozenset())
+                eligible_set &= projected
+
+            # Preserve schema order for stable result concatenation
+            eligible = [name for name in collections_in_schema if name in eligible_set]
+            logger.info(f"Querying collections: {eligible}")
+
+            # 3. Dispatch all eligible queries concurrently: the per-
+            # collection finds are independent, so total latency is the
+            # slowest collection instead of the sum of all of them
+            # limit() tells the server to stop scanning at the cap (to_list
+            # alone only stops the client fetching), and batch_size keeps
+            # each reply a bounded chunk instead of one huge getMore
+            results_lists = await asyncio.gather(*(
+                self._collection(name).find(filter_query, projection)
+                .limit(_RESULT_LIMIT).batch_size(100).to_list(_RESULT_LIMIT)
+                for name in eligible
+            ))
+            for results in results_lists:
                 all_results.extend(results)
-        
+
         elif operation == 'aggregate':
-            # Aggregations are complex. For now, we run them on all collections.
+            # Aggregations are complex. For now, we run them on all collections
+            # (concurrently; per-collection failures are logged, not fatal).
             # A smarter approach would be to parse the pipeline, but that's
             # much more complex. This remains as-is for now.
             pipeline = query_obj.get('pipeline', [])
-            for collection_name in collections_in_schema.keys():
-                collection = self.db[collection_name]
-                try:
-                    results = await collection.aggregate(pipeline).to_list(1000)
+            names = list(collections_in_schema.keys())
+            results_lists = await asyncio.gather(*(
+                self._collection(name).aggregate(pipeline).to_list(_RESULT_LIMIT)
+                for name in names
+            ), return_exceptions=True)
+            for collection_name, results in zip(names, results_lists):
+                if isinstance(results, BaseException):
+                    logger.warning(f"Aggregation failed on {collection_name}: {results}")
+                else:
                     all_results.extend(results)
-                except Exception as e:
-                    logger.warning(f"Aggregation failed on {collection_name}: {e}")
 
-        
-        return self._serialize_mongo_results(all_results)
+
+        return all_results
     
     async def _log_query(self, source_id: str, query_type: str, original_query: str, 
                         translated_query: str, result_count: int, error: str):
@@ -212,14 +275,51 @@ class QueryExecutor:
             "error": error,
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
-        
-        await self.queries_collection.insert_one(log_entry)
+
+        # Enqueue instead of awaiting insert_one inline; the flusher batches
+        # entries into one insert_many off the response path
+        self._log_queue.put_nowait(log_entry)
+        if self._log_flusher_task is None:
+            self._log_flusher_task = asyncio.get_running_loop().create_task(self._log_flusher())
+
+    async def _log_flusher(self):
+        """Background writer draining queued log entries in batches."""
+        while True:
+            try:
+                batch = [await self._log_queue.get()]
+                # Let a burst accumulate before writing
+                await asyncio.sleep(1.0)
+                while len(batch) < 100 and not self._log_queue.empty():
+                    batch.append(self._log_queue.get_nowait())
+                await self.queries_collection.insert_many(batch, ordered=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to write query log batch: {e}")
+
+    async def flush_query_logs(self):
+        """Drain queued log entries; called at server shutdown."""
+        if self._log_flusher_task is not None:
+            self._log_flusher_task.cancel()
+            self._log_flusher_task = None
+        batch = []
+        while not self._log_queue.empty():
+            batch.append(self._log_queue.get_nowait())
+        if batch:
+            await self.queries_collection.insert_many(batch, ordered=False)
     
-    async def get_query_history(self, source_id: str) -> List[Dict[str, Any]]:
-        """Get query history for a source."""
+    async def ensure_indexes(self):
+        """Create indexes backing query-history reads (no-op if present)."""
+        await self.queries_collection.create_index([("source_id", 1), ("timestamp", -1)])
+
+    async def get_query_history(self, source_id: str, limit: int = _RESULT_LIMIT,
+                                offset: int = 0) -> List[Dict[str, Any]]:
+        """Get query history for a source, newest first."""
+        # Single round-trip: filter, sort and skip are served by the
+        # compound index, the projection drops _id server-side, and limit()
+        # caps the scan on the server rather than only the client fetch
         queries = await self.queries_collection.find(
             {"source_id": source_id},
             {"_id": 0}
-        ).sort("timestamp", -1).to_list(1000)
-        # Serialize results to handle any ObjectIds
-        return self._serialize_mongo_results(queries)
\ No newline at end of file
+        ).sort("timestamp", -1).skip(offset).limit(limit).to_list(limit)
+        return queries
\ No newline at end of file
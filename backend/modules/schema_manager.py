@@ -1,14 +1,36 @@
 """Schema manager for generating and updating database schemas."""
+import asyncio
 import logging
+import time
+from collections import defaultdict
 from typing import List, Dict, Any, Set
 from datetime import datetime, timezone
+import orjson
 import re
 
 logger = logging.getLogger(__name__)
 
+# Bound once at import; skips the datetime.now attribute resolution per call
+_utcnow = datetime.now
+
 class SchemaManager:
     """Manage schema generation and evolution."""
-    
+
+    # Schemas are read on every query/records request but only change on
+    # upload. Cache them for a short TTL, class-level so the pipeline's
+    # manager and the endpoint-facing manager share one cache and
+    # generate_schema's write-through is seen by both.
+    _schema_cache: Dict[str, Any] = {}
+    _SCHEMA_CACHE_TTL = 30.0
+
+    # Inferred field schemas keyed by record-content hash: re-uploads replay
+    # identical fragments, so inference for them is pure recomputation
+    _fields_cache: Dict[int, bytes] = {}
+
+    # Once a field has shown this many non-null values of a single type,
+    # its type and sample are settled; further rows only update counters
+    _SAMPLE_CAP = 128
+
     def __init__(self, db):
         self.db = db
         self.schemas_collection = db.schemas
@@ -21,19 +43,41 @@ class SchemaManager:
         This function now creates a historical record of the schema version
         before updating the main schema document.
         """
-        # Get existing schema if any
-        existing_schema = await self.schemas_collection.find_one(
-            {"source_id": source_id},
-            {"_id": 0}
-        )
+        # One timestamp for the whole generation; created_at/updated_at of a
+        # fresh schema should agree anyway
+        now_iso = _utcnow(timezone.utc).isoformat()
+
+        # Get existing schema if any; a fresh cache entry (written through
+        # by the previous generate_schema or get_schema) saves the Mongo
+        # round-trip on rapid repeat uploads for the same source. The merge
+        # below mutates nested collection dicts in place, so a hit is
+        # deep-copied before use to keep the cached version pristine.
+        cached = SchemaManager._schema_cache.get(source_id)
+        if cached is not None and time.monotonic() - cached[0] < self._SCHEMA_CACHE_TTL:
+            existing_schema = cached[1]
+            if existing_schema is not None:
+                existing_schema = orjson.loads(orjson.dumps(existing_schema))
+        else:
+            existing_schema = await self.schemas_collection.find_one(
+                {"source_id": source_id},
+                {"_id": 0}
+            )
         
         # Infer schema from records
-        # This function now correctly infers from the 'cleaned_records' key in fragments
-        collections_schema = self._infer_collections_schema(fragments, all_records)
-        
-        # Determine data types present
-        data_types = list(set(f['type'] for f in fragments))
+        # This function now correctly infers from the 'cleaned_records' key
+        # in fragments. Inference is pure-Python CPU work; run it in a
+        # worker thread so a large batch doesn't stall every other request
+        # on the event loop while it scans.
+        collections_schema = await asyncio.get_running_loop().run_in_executor(
+            None, self._infer_collections_schema, fragments, all_records
+        )
         
+        # Determine data types present; one set accumulated in place instead
+        # of the old generator -> set -> list -> concat -> set -> list chain
+        data_types = set()
+        for f in fragments:
+            data_types.add(f['type'])
+
         if existing_schema:
             # Update existing schema
             new_version = existing_schema.get('version', 1) + 1
@@ -41,42 +85,53 @@ class SchemaManager:
                 existing_schema.get('collections', {}),
                 collections_schema
             )
-            
+            data_types.update(existing_schema.get('data_types_present', ()))
+
             schema = {
                 "source_id": source_id,
                 "version": new_version,
                 "created_at": existing_schema['created_at'],
-                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "updated_at": now_iso,
                 "collections": merged_collections,
-                "data_types_present": list(set(existing_schema.get('data_types_present', []) + data_types))
+                "data_types_present": list(data_types)
             }
         else:
             # Create new schema
             schema = {
                 "source_id": source_id,
                 "version": 1,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "created_at": now_iso,
+                "updated_at": now_iso,
                 "collections": collections_schema,
-                "data_types_present": data_types
+                "data_types_present": list(data_types)
             }
         
         # 1. Log Schema History (The key change for immutable history)
-        # We save a copy of the new schema version here.
-        schema_copy = schema.copy()
+        # We save a copy of the new schema version here. The orjson
+        # round-trip is a true deep snapshot (a shallow .copy() would share
+        # the nested collections dicts with the live schema) at a fraction
+        # of copy.deepcopy's cost.
+        schema_copy = orjson.loads(orjson.dumps(schema))
         # Ensure _id is not saved if it somehow slipped in
         if "_id" in schema_copy:
             del schema_copy["_id"]
-        await self.schema_history_collection.insert_one(schema_copy)
-        logger.info(f"Schema history logged for source_id={source_id}, version={schema['version']}")
 
-        # 2. Save Current Schema (for quick lookup)
-        await self.schemas_collection.update_one(
-            {"source_id": source_id},
-            {"$set": schema},
-            upsert=True
+        # 2. Save Current Schema (for quick lookup). The history insert and
+        # the upsert are independent documents in different collections, so
+        # issue them concurrently rather than paying two serial round-trips.
+        await asyncio.gather(
+            self.schema_history_collection.insert_one(schema_copy),
+            self.schemas_collection.update_one(
+                {"source_id": source_id},
+                {"$set": schema},
+                upsert=True
+            )
         )
-        
+        logger.info(f"Schema history logged for source_id={source_id}, version={schema['version']}")
+
+        # Write through the cache so readers see the new version immediately
+        SchemaManager._schema_cache[source_id] = (time.monotonic(), schema)
+
         logger.info(f"Schema generated and updated for source_id={source_id}, version={schema['version']}")
         return schema
     
@@ -85,14 +140,20 @@ class SchemaManager:
         """Infer schema for collections based on data fragments."""
         collections = {}
         
-        # Group records by fragment type
+        # Group records by fragment type. Direct [] lookups with KeyError
+        # handling beat .get with a default here: the keys are present for
+        # virtually every fragment, so the happy path skips the bound-method
+        # call and the default allocation.
         for fragment in fragments:
             frag_type = fragment['type']
-            
+
             # --- THIS IS THE FIX ---
             # We now build the schema from the CLEANED data, not the original parsed data.
             # This ensures schema types (e.g., number) match the DB (e.g., number).
-            records_to_infer_from = fragment.get('cleaned_records', [])
+            try:
+                records_to_infer_from = fragment['cleaned_records']
+            except KeyError:
+                records_to_infer_from = None
             # --- END FIX ---
 
             if not records_to_infer_from:
@@ -109,7 +170,7 @@ class SchemaManager:
             collection_name = f"{frag_type}_data"
             
             # Infer field types
-            fields_schema = self._infer_fields_schema(records_to_infer_from)
+            fields_schema = self._infer_fields_schema_cached(records_to_infer_from)
             
             if collection_name in collections:
                 # Merge with existing collection schema
@@ -127,134 +188,202 @@ class SchemaManager:
         
         return collections
     
+    def _infer_fields_schema_cached(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Memoized _infer_fields_schema keyed by record content.
+
+        The cache stores the schema serialized and rehydrates it per hit,
+        so the in-place mutations done by later merges can never corrupt a
+        cached entry. Unhashable/unserializable batches just recompute.
+        """
+        try:
+            key = hash(orjson.dumps(records, option=orjson.OPT_SORT_KEYS))
+        except TypeError:
+            return self._infer_fields_schema(records)
+
+        cached = SchemaManager._fields_cache.get(key)
+        if cached is not None:
+            return orjson.loads(cached)
+
+        fields_schema = self._infer_fields_schema(records)
+        if len(SchemaManager._fields_cache) >= 128:
+            SchemaManager._fields_cache.clear()
+        try:
+            SchemaManager._fields_cache[key] = orjson.dumps(fields_schema)
+        except TypeError:
+            pass
+        return fields_schema
+
     def _infer_fields_schema(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Infer field types from records."""
+        """Infer field types from records.
+
+        Single streaming pass keeping per-field counters (presence count,
+        observed types, first non-null sample) instead of materializing a
+        list of every value per field and re-scanning it.
+        """
         fields = {}
         total_records = len(records)
-        
-        # Collect all fields and their values
-        field_values = {}
+
+        # defaultdict turns the miss path into one C-level __missing__ call
+        # instead of a lookup + branch + assign + second lookup per field
+        def _new_stats():
+            return {"count": 0, "non_null": 0, "types": set(),
+                    "sample": None, "frozen": False}
+
+        field_stats: Dict[str, Dict[str, Any]] = defaultdict(_new_stats)
+        # Rows from one source usually share one key set; seeding from the
+        # first record pre-sizes the table and makes every later lookup an
+        # existing-key hit instead of a __missing__ insert
+        if records and isinstance(records[0], dict):
+            field_stats.update((key, _new_stats()) for key in records[0])
+
         for record in records:
             if not isinstance(record, dict):
                 continue
             for key, value in record.items():
-                if key not in field_values:
-                    field_values[key] = []
-                field_values[key].append(value)
-        
-        # Infer type and requirements for each field
-        for field_name, values in field_values.items():
-            non_null_values = [v for v in values if v is not None]
-            
-            if not non_null_values:
+                stats = field_stats[key]
+                stats["count"] += 1
+                if value is None:
+                    continue
+                # Frozen fields (stable single type past the sample cap)
+                # only count presence; type/sample work is done. Keeps the
+                # inner loop O(F*K) on large homogeneous batches while the
+                # required flag stays exact.
+                if stats["frozen"]:
+                    stats["non_null"] += 1
+                    continue
+                if stats["non_null"] == 0:
+                    stats["sample"] = value
+                stats["non_null"] += 1
+                types = stats["types"]
+                types.add(type(value))
+                if stats["non_null"] >= self._SAMPLE_CAP and len(types) == 1:
+                    stats["frozen"] = True
+
+        for field_name, stats in field_stats.items():
+            if not stats["non_null"]:
                 fields[field_name] = {
                     "type": "null",
                     "required": False,
                     "sample": None
                 }
                 continue
-            
-            # Infer type from non-null values
-            field_type = self._infer_type(non_null_values)
-      
-            # Check if all values of this field are present
-            is_required = len(values) == total_records
-            
-            # Check if all *records* have this field
-            field_present_in_all_records = len(values) == total_records
-            # This logic might need refinement: a field is required if it exists
-            # in every record *that belongs to this type*.
-            # The current logic is simpler: is it present in all records *in this batch*?
-            
+
+            # A field is required if it is present in all records *in this
+            # batch*; refinement to per-type presence is left as-is.
             fields[field_name] = {
-                "type": field_type,
-                "required": field_present_in_all_records,
-                "sample": non_null_values[0] if non_null_values else None
+                "type": self._infer_type(stats["types"]),
+                "required": stats["count"] == total_records,
+                "sample": stats["sample"]
             }
-        
+
         return fields
-    
-    def _infer_type(self, values: List[Any]) -> str:
-        """Infer type from list of values."""
-        if not values:
+
+    # Exact-type dispatch table; the stats pass collects type(value), so a
+    # bool never aliases to int here the way an isinstance chain must guard
+    _TYPE_MAP = {
+        bool: "boolean",
+        int: "integer",
+        float: "float",
+        str: "string",
+        list: "array",
+        dict: "object",
+    }
+
+    def _infer_type(self, types_present: Set[type]) -> str:
+        """Infer schema type from the set of observed non-null value types."""
+        if not types_present:
             return "unknown"
-        
-        # Check first non-null value
-        types_present = set(type(v) for v in values)
-        
+
         if len(types_present) > 1:
              # Handle mixed lists, e.g., [1, "2.5"]
             if str in types_present or float in types_present or int in types_present:
                 return "string" # Default to string if mixed
             return "mixed"
-        
-        sample = values[0]
-        
-        if isinstance(sample, bool):
-            return "boolean"
-        elif isinstance(sample, int):
-            return "integer"
-        elif isinstance(sample, float):
-            return "float"
-        elif isinstance(sample, str):
-            return "string"
-        elif isinstance(sample, list):
-            return "array"
-        elif isinstance(sample, dict):
-            return "object"
-        else:
-            return "unknown"
+
+        return self._TYPE_MAP.get(next(iter(types_present)), "unknown")
     
     def _merge_field_schemas(self, existing: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
         """Merge two field schemas."""
+        # Nothing new to fold in — skip the copy-and-loop entirely. (No
+        # matching shortcut for empty `existing`: that path must still mark
+        # each incoming field as not-required.)
+        if not new:
+            return dict(existing)
+
         merged = existing.copy()
-        
+
         for field_name, field_info in new.items():
-            if field_name in merged:
+            # Fetch once; the old code re-looked up merged[field_name] for
+            # every read and write on the intersection path
+            current = merged.get(field_name)
+            if current is not None:
                 # Update type if different
                 # If one is string, the merged type should be string
-                if 'string' in (merged[field_name]['type'], field_info['type']):
-                    merged[field_name]['type'] = 'string'
-                elif merged[field_name]['type'] != field_info['type']:
-                    merged[field_name]['type'] = 'mixed' # e.g., int and float
-                
+                if 'string' in (current['type'], field_info['type']):
+                    current['type'] = 'string'
+                elif current['type'] != field_info['type']:
+                    current['type'] = 'mixed' # e.g., int and float
+
                 # Update required status (field is required only if always present)
-                merged[field_name]['required'] = merged[field_name]['required'] and field_info['required']
-                
+                current['required'] = current['required'] and field_info['required']
+
                 # Update sample
-                merged[field_name]['sample'] = field_info['sample']
+                current['sample'] = field_info['sample']
             else:
                 # This is a new field, it's not required for *all* records
                 field_info['required'] = False
                 merged[field_name] = field_info
-        
+
         return merged
     
     def _merge_schemas(self, existing: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
         """Merge existing schema with new schema."""
+        if not existing:
+            return dict(new)
+        if not new:
+            return dict(existing)
+
         merged = existing.copy()
-        
+
         for collection_name, collection_info in new.items():
-            if collection_name in merged:
+            current = merged.get(collection_name)
+            if current is not None:
                 # Merge field schemas
-                merged[collection_name]['fields'] = self._merge_field_schemas(
-                    merged[collection_name]['fields'],
+                current['fields'] = self._merge_field_schemas(
+                    current['fields'],
                     collection_info['fields']
                 )
                 # We need to be careful with record counts.
                 # This simple add is correct for *new* data.
-                merged[collection_name]['record_count'] += collection_info['record_count']
+                current['record_count'] += collection_info['record_count']
             else:
                 merged[collection_name] = collection_info
-        
+
         return merged
     
+    async def ensure_indexes(self):
+        """Create indexes backing schema lookups and history (no-op if present)."""
+        # get_schema_history filters by source_id and sorts by version
+        # descending; without this the sort is done in memory over the
+        # whole collection. The schemas index serves the per-source
+        # find_one/upsert.
+        await asyncio.gather(
+            self.schema_history_collection.create_index(
+                [("source_id", 1), ("version", -1)]),
+            self.schemas_collection.create_index("source_id")
+        )
+
     async def get_schema(self, source_id: str) -> Dict[str, Any]:
         """Get CURRENT schema for a source."""
+        cached = SchemaManager._schema_cache.get(source_id)
+        if cached is not None and time.monotonic() - cached[0] < self._SCHEMA_CACHE_TTL:
+            return cached[1]
+
         schema = await self.schemas_collection.find_one(
             {"source_id": source_id},
             {"_id": 0}
         )
+        SchemaManager._schema_cache[source_id] = (time.monotonic(), schema)
         return schema
     
     async def get_schema_history(self, source_id: str) -> List[Dict[str, Any]]:
@@ -1,13 +1,117 @@
 """Streamlit frontend for ETL Pipeline System."""
 import streamlit as st
 import requests
-import json
+from requests.adapters import HTTPAdapter, Retry
+from requests_toolbelt import MultipartEncoder
+import orjson
+import pandas as pd
 import os
 from pathlib import Path
 
 # Configuration
 API_URL = os.environ.get('API_URL', 'http://localhost:8000/api')
 
+
+@st.cache_resource
+def get_session():
+    """Shared requests.Session with pooled keep-alive connections.
+
+    Streamlit reruns this script on every interaction, so bare requests.*
+    calls would open a fresh TCP connection per click; the cached session
+    reuses connections across reruns and retries transient gateway errors.
+    """
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    session.mount('http://', HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.2,
+                          status_forcelist=[502, 503, 504])
+    ))
+    return session
+
+
+def _json(response):
+    """Decode a response body with orjson, skipping the intermediate str."""
+    return orjson.loads(response.content)
+
+
+# Cached GET wrappers: Streamlit reruns the script on any widget change,
+# so uncached fetches repeat the same network round-trip and JSON parse
+# on every click. 30s TTL matches the backend's own schema cache; the
+# upload page clears these after a successful ETL run. Each returns
+# (status_code, parsed body or error text) so 404s cache too.
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_schema(source_id):
+    response = get_session().get(f"{API_URL}/schema", params={'source_id': source_id})
+    return response.status_code, _json(response) if response.status_code == 200 else response.text
+
+
+PAGE_SIZE = 25
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_upload_history(source_id, page=1):
+    response = get_session().get(
+        f"{API_URL}/history/uploads",
+        params={'source_id': source_id, 'limit': PAGE_SIZE, 'offset': (page - 1) * PAGE_SIZE}
+    )
+    return response.status_code, _json(response) if response.status_code == 200 else response.text
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_query_history(source_id, page=1):
+    response = get_session().get(
+        f"{API_URL}/history/queries",
+        params={'source_id': source_id, 'limit': PAGE_SIZE, 'offset': (page - 1) * PAGE_SIZE}
+    )
+    return response.status_code, _json(response) if response.status_code == 200 else response.text
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_overview(source_id):
+    response = get_session().get(f"{API_URL}/overview", params={'source_id': source_id})
+    return response.status_code, _json(response) if response.status_code == 200 else response.text
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_schema_history(source_id):
+    response = get_session().get(f"{API_URL}/history/schema", params={'source_id': source_id})
+    return response.status_code, _json(response) if response.status_code == 200 else response.text
+
+
+def render_json_safe(obj, cap=200, file_name='data.json'):
+    """Render JSON with a size guard.
+
+    st.json ships the whole object to the browser and formats it there;
+    a multi-thousand-record result or megabyte schema freezes the tab on
+    every rerun. Large payloads render a truncated preview plus a
+    download button for the full JSON instead.
+    """
+    if isinstance(obj, list) and len(obj) > cap:
+        st.json(obj[:cap])
+        st.caption(f"Showing first {cap} of {len(obj)} items")
+        st.download_button(
+            "⬇️ Download full JSON",
+            data=orjson.dumps(obj),
+            file_name=file_name,
+            mime='application/json',
+            key=f"download_{file_name}"
+        )
+        return
+    payload = orjson.dumps(obj)
+    if len(payload) > 256 * 1024:
+        st.info(f"JSON too large to render inline ({len(payload) / 1024:.0f} KB)")
+        st.download_button(
+            "⬇️ Download full JSON",
+            data=payload,
+            file_name=file_name,
+            mime='application/json',
+            key=f"download_{file_name}"
+        )
+        return
+    st.json(obj)
+
 # Page config
 st.set_page_config(
     page_title="ETL Pipeline System",
@@ -15,8 +119,12 @@ st.set_page_config(
     layout="wide"
 )
 
-# Custom CSS
-st.markdown("""
+# Custom CSS. The stylesheet string is built once per server process;
+# the st.markdown call itself must still run every rerun, since Streamlit
+# rebuilds the element tree and a skipped call would drop the styles.
+@st.cache_resource
+def _css():
+    return """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -63,7 +171,10 @@ st.markdown("""
         border-radius: 5px;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+st.markdown(_css(), unsafe_allow_html=True)
 
 # Title
 st.markdown('<h1 class="main-header">🔄 Dynamic ETL Pipeline System</h1>', unsafe_allow_html=True)
@@ -82,14 +193,26 @@ if 'source_id' not in st.session_state:
 if 'last_upload_result' not in st.session_state:
     st.session_state.last_upload_result = None
 
-# Source ID input (persistent across pages)
+# Source ID input (persistent across pages). A form batches the edit:
+# a bare text_input reruns the whole script on every keystroke, and with
+# the fetches cached per source_id each keystroke was a cache miss and a
+# backend hit. Nothing downstream changes until Apply is pressed.
 st.sidebar.markdown("---")
 st.sidebar.markdown("### Source Configuration")
-st.session_state.source_id = st.sidebar.text_input(
-    "Source ID",
-    value=st.session_state.source_id,
-    help="Unique identifier for your data source"
-)
+with st.sidebar.form('source_config', border=False):
+    draft_source_id = st.text_input(
+        "Source ID",
+        value=st.session_state.source_id,
+        help="Unique identifier for your data source"
+    )
+    if st.form_submit_button("Apply"):
+        if draft_source_id != st.session_state.source_id:
+            # Per-source views persisted in session_state would otherwise
+            # keep showing the previous source's data under the new banner
+            # until a refresh button happened to be pressed
+            for stale_key in ('upload_history', 'query_history', 'schema_view'):
+                st.session_state.pop(stale_key, None)
+        st.session_state.source_id = draft_source_id
 
 # Page: Upload & Process
 if page == "Upload & Process":
@@ -117,130 +240,227 @@ if page == "Upload & Process":
         st.markdown("### Upload Info")
         st.info(f"**Source ID:** {st.session_state.source_id}")
         if uploaded_file:
+            # Only recompute the preview when the file actually changes,
+            # not on every widget-triggered rerun
+            if uploaded_file.file_id != st.session_state.get('last_file_id'):
+                st.session_state.last_file_id = uploaded_file.file_id
+                st.session_state.file_kb = uploaded_file.size / 1024
             st.success(f"**File:** {uploaded_file.name}")
-            st.write(f"**Size:** {uploaded_file.size / 1024:.2f} KB")
+            st.write(f"**Size:** {st.session_state.file_kb:.2f} KB")
     
+    # The upload runs as a background job: the POST returns a job_id as
+    # soon as the file is saved, and a timed fragment polls /jobs/{id}.
+    # A synchronous POST held the script thread (and the whole UI) for up
+    # to two minutes of pipeline time.
     if st.button("🚀 Process File", type="primary", disabled=not uploaded_file):
         if uploaded_file:
-            with st.spinner("Processing file through ETL pipeline..."):
-                try:
-                    # Prepare multipart form data
-                    files = {'file': (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-                    data = {'source_id': st.session_state.source_id}
-                    
-                    # Upload file
-                    response = requests.post(
-                        f"{API_URL}/upload",
-                        files=files,
-                        data=data,
-                        timeout=120
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        st.session_state.last_upload_result = result
-                        
-                        if result.get('status') == 'success':
-                            st.markdown('<div class="success-box">✅ File processed successfully!</div>', unsafe_allow_html=True)
-                            
-                            # Display summary
-                            summary = result.get('parsed_summary', {})
-                            
-                            col1, col2, col3 = st.columns(3)
-                            with col1:
-                                st.metric("Total Fragments", summary.get('total_fragments', 0))
-                            with col2:
-                                st.metric("Total Records", summary.get('total_records', 0))
-                            with col3:
-                                data_types = summary.get('data_types', [])
-                                st.metric("Data Types", ', '.join(data_types))
-                            
-                            # Fragment details
-                            st.markdown("### 📊 Extracted Fragments")
-                            for frag in summary.get('fragments', []):
-                                with st.expander(f"{frag['type'].upper()} (Lines {frag['start_line']}-{frag['end_line']}) - {frag['record_count']} records"):
-                                    if frag.get('sample'):
-                                        st.json(frag['sample'])
-                            
-                            # Schema info
-                            st.markdown("### 🗂️ Schema Generated")
-                            schema = result.get('schema', {})
-                            st.write(f"**Version:** {schema.get('version', 'N/A')}")
-                            st.write(f"**Collections:** {len(schema.get('collections', {}))}")
-                            
-                            with st.expander("View Full Schema"):
-                                st.json(schema)
-                        else:
-                            st.markdown(f'<div class="error-box">❌ Error: {result.get("error_message")}</div>', unsafe_allow_html=True)
-                    else:
-                        st.error(f"Upload failed: {response.status_code} - {response.text}")
-                
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
+            try:
+                # Stream the multipart body instead of materializing it:
+                # getvalue() plus requests' files= handling held two full
+                # copies of the file in memory, while the encoder reads
+                # the buffer in chunks as the socket drains
+                uploaded_file.seek(0)
+                encoder = MultipartEncoder(fields={
+                    'source_id': st.session_state.source_id,
+                    'file': (uploaded_file.name, uploaded_file,
+                             uploaded_file.type or 'application/octet-stream')
+                })
+
+                response = get_session().post(
+                    f"{API_URL}/upload/async",
+                    data=encoder,
+                    headers={'Content-Type': encoder.content_type},
+                    # Split connect/read: fail fast when the backend is
+                    # unreachable instead of burning the whole read budget,
+                    # while still leaving the body stream plenty of time
+                    timeout=(5, 120)
+                )
+
+                if response.status_code == 200:
+                    st.session_state.active_job = _json(response)['job_id']
+                    st.session_state.last_upload_result = None
+                else:
+                    st.error(f"Upload failed: {response.status_code} - {response.text}")
+
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+
+    if st.session_state.get('active_job'):
+        @st.fragment(run_every=1.0)
+        def _poll_upload_job():
+            job_id = st.session_state.get('active_job')
+            if not job_id:
+                return
+            try:
+                response = get_session().get(f"{API_URL}/jobs/{job_id}", timeout=(3, 10))
+            except Exception as e:
+                st.error(f"Error polling job: {str(e)}")
+                return
+            if response.status_code != 200:
+                st.session_state.active_job = None
+                st.error(f"Job lookup failed: {response.status_code}")
+                return
+
+            job = _json(response)
+            if job['status'] == 'running':
+                st.info("⏳ Processing file through ETL pipeline...")
+                return
+
+            st.session_state.active_job = None
+            if job['status'] == 'done':
+                st.session_state.last_upload_result = job.get('result')
+                # The upload changed what the cached GETs return
+                fetch_schema.clear()
+                fetch_upload_history.clear()
+                fetch_schema_history.clear()
+                fetch_overview.clear()
+                st.session_state.pop('upload_history', None)
+                st.session_state.pop('query_history', None)
+            else:
+                st.session_state.last_upload_result = {
+                    'status': 'error',
+                    'error_message': job.get('error')
+                }
+            st.rerun(scope="app")
+
+        _poll_upload_job()
+
+    result = st.session_state.last_upload_result
+    if result is not None:
+        if result.get('status') == 'success':
+            st.markdown('<div class="success-box">✅ File processed successfully!</div>', unsafe_allow_html=True)
+
+            # Display summary
+            summary = result.get('parsed_summary', {})
+
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Total Fragments", summary.get('total_fragments', 0))
+            with col2:
+                st.metric("Total Records", summary.get('total_records', 0))
+            with col3:
+                data_types = summary.get('data_types', [])
+                st.metric("Data Types", ', '.join(data_types))
+
+            # Fragment details. The summary goes through
+            # st.dataframe, whose grid only renders the
+            # visible rows; one st.expander per fragment
+            # builds the full DOM up front and stalls the
+            # page once files produce hundreds of fragments,
+            # so sample expanders are capped.
+            st.markdown("### 📊 Extracted Fragments")
+            fragments = summary.get('fragments', [])
+            st.dataframe(
+                [
+                    {
+                        "Type": frag['type'].upper(),
+                        "Lines": f"{frag['start_line']}-{frag['end_line']}",
+                        "Records": frag['record_count']
+                    }
+                    for frag in fragments
+                ],
+                use_container_width=True
+            )
+            for frag in fragments[:20]:
+                with st.expander(f"{frag['type'].upper()} (Lines {frag['start_line']}-{frag['end_line']}) - {frag['record_count']} records"):
+                    if frag.get('sample'):
+                        st.json(frag['sample'])
+            if len(fragments) > 20:
+                st.caption(f"Samples shown for the first 20 of {len(fragments)} fragments")
+
+            # Schema info
+            st.markdown("### 🗂️ Schema Generated")
+            schema = result.get('schema', {})
+            st.write(f"**Version:** {schema.get('version', 'N/A')}")
+            st.write(f"**Collections:** {len(schema.get('collections', {}))}")
+
+            with st.expander("View Full Schema"):
+                render_json_safe(schema, file_name='schema.json')
+        else:
+            st.markdown(f'<div class="error-box">❌ Error: {result.get("error_message")}</div>', unsafe_allow_html=True)
 
 # Page: View Schema
 elif page == "View Schema":
     st.markdown('<div class="section-header">🗂️ View Schema</div>', unsafe_allow_html=True)
     
+    # Fetch stores the result in session_state and rendering happens
+    # outside the button branch, so the filter input below can rerun the
+    # script without losing the schema view.
     if st.button("🔄 Fetch Schema"):
         with st.spinner("Fetching schema..."):
             try:
-                response = requests.get(
-                    f"{API_URL}/schema",
-                    params={'source_id': st.session_state.source_id}
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    schema = result.get('schema', {})
-                    
-                    st.success("Schema fetched successfully!")
-                    
-                    # Schema metadata
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.metric("Version", schema.get('version', 'N/A'))
-                    with col2:
-                        st.metric("Collections", len(schema.get('collections', {})))
-                    with col3:
-                        data_types = schema.get('data_types_present', [])
-                        st.metric("Data Types", ', '.join(data_types))
-                    
-                    # Collection details
-                    st.markdown("### Collections")
-                    collections = schema.get('collections', {})
-                    
-                    for coll_name, coll_info in collections.items():
-                        with st.expander(f"📦 {coll_name} ({coll_info.get('record_count', 0)} records)"):
-                            st.write(f"**Source Type:** {coll_info.get('source_type', 'N/A')}")
-                            
-                            st.markdown("**Fields:**")
-                            fields = coll_info.get('fields', {})
-                            
-                            # Create fields table
-                            field_data = []
-                            for field_name, field_info in fields.items():
-                                field_data.append({
-                                    "Field": field_name,
-                                    "Type": field_info.get('type', 'unknown'),
-                                    "Required": "✓" if field_info.get('required') else "✗",
-                                    "Sample": str(field_info.get('sample', ''))[:50]
-                                })
-                            
-                            st.table(field_data)
-                    
-                    # Full schema JSON
-                    with st.expander("📄 View Raw Schema JSON"):
-                        st.json(schema)
-                
-                elif response.status_code == 404:
-                    st.warning(f"No schema found for source_id: {st.session_state.source_id}")
-                else:
-                    st.error(f"Error: {response.status_code} - {response.text}")
-            
+                st.session_state.schema_view = fetch_schema(st.session_state.source_id)
             except Exception as e:
+                st.session_state.schema_view = None
                 st.error(f"Error: {str(e)}")
 
+    if st.session_state.get('schema_view'):
+        status_code, payload = st.session_state.schema_view
+
+        if status_code == 200:
+            schema = payload.get('schema', {})
+
+            # Schema metadata
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Version", schema.get('version', 'N/A'))
+            with col2:
+                st.metric("Collections", len(schema.get('collections', {})))
+            with col3:
+                data_types = schema.get('data_types_present', [])
+                st.metric("Data Types", ', '.join(data_types))
+
+            # Collection details. The filter bounds how many expanders
+            # and field rows get built per rerun: with a wide schema only
+            # matching collections/fields turn into widgets.
+            st.markdown("### Collections")
+            collections = schema.get('collections', {})
+            schema_filter = st.text_input(
+                "Filter collections/fields",
+                placeholder="e.g. price"
+            ).lower()
+
+            for coll_name, coll_info in collections.items():
+                fields = coll_info.get('fields', {})
+                if schema_filter and schema_filter not in coll_name.lower() \
+                        and not any(schema_filter in f.lower() for f in fields):
+                    continue
+
+                with st.expander(f"📦 {coll_name} ({coll_info.get('record_count', 0)} records)"):
+                    st.write(f"**Source Type:** {coll_info.get('source_type', 'N/A')}")
+
+                    st.markdown("**Fields:**")
+                    # A filter hit on the collection name shows all of its
+                    # fields; otherwise narrow to the matching fields
+                    if schema_filter and schema_filter not in coll_name.lower():
+                        fields = {name: info for name, info in fields.items()
+                                  if schema_filter in name.lower()}
+
+                    # Build the fields table with vectorized pandas ops
+                    # instead of a per-field dict loop; pandas ships with
+                    # streamlit, and st.dataframe renders a DataFrame
+                    # without converting through records anyway
+                    field_df = pd.DataFrame.from_dict(fields, orient='index')
+                    field_df = field_df.reindex(columns=['type', 'required', 'sample'])
+                    field_df['required'] = field_df['required'].map({True: "✓"}).fillna("✗")
+                    field_df['sample'] = field_df['sample'].astype(str).str.slice(0, 50)
+                    field_df = field_df.rename_axis('Field').reset_index().rename(
+                        columns={'type': 'Type', 'required': 'Required', 'sample': 'Sample'}
+                    )
+
+                    # Virtualized grid: st.table renders every row
+                    # eagerly, which drags with wide schemas
+                    st.dataframe(field_df, use_container_width=True)
+
+            # Full schema JSON
+            with st.expander("📄 View Raw Schema JSON"):
+                render_json_safe(schema, file_name='schema.json')
+
+        elif status_code == 404:
+            st.warning(f"No schema found for source_id: {st.session_state.source_id}")
+        else:
+            st.error(f"Error: {status_code} - {payload}")
+
 # Page: Query Data
 elif page == "Query Data":
     st.markdown('<div class="section-header">🔍 Query Data</div>', unsafe_allow_html=True)
@@ -267,17 +487,18 @@ elif page == "Query Data":
         if st.button("🚀 Execute Query", type="primary", disabled=not nl_query):
             with st.spinner("Translating and executing query..."):
                 try:
-                    response = requests.post(
+                    response = get_session().post(
                         f"{API_URL}/query",
-                        json={
+                        data=orjson.dumps({
                             "source_id": st.session_state.source_id,
                             "query_type": "NL",
                             "query_text": nl_query
-                        }
+                        }),
+                        headers={'Content-Type': 'application/json'}
                     )
                     
                     if response.status_code == 200:
-                        result = response.json()
+                        result = _json(response)
                         
                         if result.get('error'):
                             st.error(f"Query Error: {result['error']['message']}")
@@ -294,7 +515,8 @@ elif page == "Query Data":
                             st.write(f"**Found {len(results)} records**")
                             
                             if results:
-                                st.json(results)
+                                with st.expander("View result JSON", expanded=False):
+                                    render_json_safe(results, file_name='query_results.json')
                             else:
                                 st.info("No results found")
                     else:
@@ -319,19 +541,28 @@ elif page == "Query Data":
         )
         
         if st.button("🚀 Execute Query", type="primary", disabled=not db_query):
+            # Fail malformed JSON locally instead of round-tripping to the
+            # backend just to hear it's invalid
+            try:
+                orjson.loads(db_query)
+            except orjson.JSONDecodeError as e:
+                st.error(f"Invalid JSON: {e}")
+                st.stop()
+
             with st.spinner("Executing query..."):
                 try:
-                    response = requests.post(
+                    response = get_session().post(
                         f"{API_URL}/query",
-                        json={
+                        data=orjson.dumps({
                             "source_id": st.session_state.source_id,
                             "query_type": "DB",
                             "query_text": db_query
-                        }
+                        }),
+                        headers={'Content-Type': 'application/json'}
                     )
                     
                     if response.status_code == 200:
-                        result = response.json()
+                        result = _json(response)
                         
                         if result.get('error'):
                             st.error(f"Query Error: {result['error']['message']}")
@@ -344,7 +575,8 @@ elif page == "Query Data":
                             st.write(f"**Found {len(results)} records**")
                             
                             if results:
-                                st.json(results)
+                                with st.expander("View result JSON", expanded=False):
+                                    render_json_safe(results, file_name='query_results.json')
                             else:
                                 st.info("No results found")
                     else:
@@ -356,93 +588,122 @@ elif page == "Query Data":
 # Page: History
 elif page == "History":
     st.markdown('<div class="section-header">📜 History</div>', unsafe_allow_html=True)
-    
+
+    # Seed both history tabs from the combined /overview endpoint: one
+    # round-trip instead of a fetch click per tab. The fetch buttons
+    # still drive paged refreshes through the individual endpoints.
+    if 'upload_history' not in st.session_state or 'query_history' not in st.session_state:
+        try:
+            status_code, payload = fetch_overview(st.session_state.source_id)
+            if status_code == 200:
+                st.session_state.upload_history = (200, {'uploads': payload.get('recent_uploads', [])})
+                st.session_state.query_history = (200, {'queries': payload.get('recent_queries', [])})
+        except Exception:
+            pass  # tabs fall back to their own fetch buttons
+
     # NEW TAB ADDED
     tab1, tab2, tab3 = st.tabs(["Upload History", "Query History", "Schema History"])
     
+    # Both tabs render one virtualized st.dataframe instead of an
+    # expander + st.write stack per row, and keep the fetched page in
+    # session_state so the grid (and a row selection) survives the
+    # rerun every widget interaction triggers.
     with tab1:
+        upload_page = st.number_input("Page", min_value=1, step=1, key="upload_history_page")
         if st.button("🔄 Fetch Upload History"):
             with st.spinner("Fetching history..."):
                 try:
-                    response = requests.get(
-                        f"{API_URL}/history/uploads",
-                        params={'source_id': st.session_state.source_id}
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        uploads = result.get('uploads', [])
-                        
-                        if uploads:
-                            st.success(f"Found {len(uploads)} uploads")
-                            
-                            for i, upload in enumerate(uploads, 1):
-                                with st.expander(f"Upload #{i} - {upload.get('file_path')} ({upload.get('timestamp')})"):
-                                    col1, col2 = st.columns(2)
-                                    with col1:
-                                        st.write(f"**File Type:** {upload.get('file_type')}")
-                                        st.write(f"**Fragments:** {upload.get('fragments_count')}")
-                                    with col2:
-                                        st.write(f"**Records:** {upload.get('record_count')}")
-                                        st.write(f"**Data Types:** {', '.join(upload.get('data_types', []))}")
-                        else:
-                            st.info("No upload history found")
-                    else:
-                        st.error(f"Error: {response.status_code}")
-                
+                    st.session_state.upload_history = fetch_upload_history(
+                        st.session_state.source_id, upload_page)
                 except Exception as e:
+                    st.session_state.upload_history = None
                     st.error(f"Error: {str(e)}")
-    
+
+        if st.session_state.get('upload_history'):
+            status_code, payload = st.session_state.upload_history
+
+            if status_code == 200:
+                uploads = payload.get('uploads', [])
+
+                if uploads:
+                    st.success(f"Found {len(uploads)} uploads on page {upload_page}")
+                    st.dataframe(
+                        [
+                            {
+                                "Timestamp": upload.get('timestamp'),
+                                "File": upload.get('file_path'),
+                                "Type": upload.get('file_type'),
+                                "Fragments": upload.get('fragments_count'),
+                                "Records": upload.get('record_count'),
+                                "Data Types": ', '.join(upload.get('data_types', []))
+                            }
+                            for upload in uploads
+                        ],
+                        use_container_width=True
+                    )
+                else:
+                    st.info("No upload history found")
+            else:
+                st.error(f"Error: {status_code}")
+
     with tab2:
+        query_page = st.number_input("Page", min_value=1, step=1, key="query_history_page")
         if st.button("🔄 Fetch Query History"):
             with st.spinner("Fetching history..."):
                 try:
-                    response = requests.get(
-                        f"{API_URL}/history/queries",
-                        params={'source_id': st.session_state.source_id}
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        queries = result.get('queries', [])
-                        
-                        if queries:
-                            st.success(f"Found {len(queries)} queries")
-                            
-                            for i, query in enumerate(queries, 1):
-                                with st.expander(f"Query #{i} - {query.get('query_type')} ({query.get('timestamp')})"):
-                                    st.write(f"**Type:** {query.get('query_type')}")
-                                    st.write(f"**Original Query:**")
-                                    st.code(query.get('original_query', ''))
-                                    
-                                    if query.get('translated_query'):
-                                        st.write(f"**Translated Query:**")
-                                        st.code(query.get('translated_query', ''))
-                                    
-                                    st.write(f"**Result Count:** {query.get('result_count', 0)}")
-                                    
-                                    if query.get('error'):
-                                        st.error(f"Error: {query['error']}")
-                        else:
-                            st.info("No query history found")
-                    else:
-                        st.error(f"Error: {response.status_code}")
-                
+                    st.session_state.query_history = fetch_query_history(
+                        st.session_state.source_id, query_page)
                 except Exception as e:
+                    st.session_state.query_history = None
                     st.error(f"Error: {str(e)}")
+
+        if st.session_state.get('query_history'):
+            status_code, payload = st.session_state.query_history
+
+            if status_code == 200:
+                queries = payload.get('queries', [])
+
+                if queries:
+                    st.success(f"Found {len(queries)} queries on page {query_page}")
+                    event = st.dataframe(
+                        [
+                            {
+                                "Timestamp": query.get('timestamp'),
+                                "Type": query.get('query_type'),
+                                "Results": query.get('result_count', 0),
+                                "Error": query.get('error') or ''
+                            }
+                            for query in queries
+                        ],
+                        use_container_width=True,
+                        on_select='rerun',
+                        selection_mode='single-row',
+                        key='query_history_grid'
+                    )
+
+                    # Query text only renders for the selected row
+                    for row in event.selection.rows:
+                        query = queries[row]
+                        st.write("**Original Query:**")
+                        st.code(query.get('original_query', ''))
+                        if query.get('translated_query'):
+                            st.write("**Translated Query:**")
+                            st.code(query.get('translated_query', ''))
+                        if query.get('error'):
+                            st.error(f"Error: {query['error']}")
+                else:
+                    st.info("No query history found")
+            else:
+                st.error(f"Error: {status_code}")
     
     with tab3: # <-- SCHEMA HISTORY TAB IMPLEMENTATION
         if st.button("🔄 Fetch Schema History"):
             with st.spinner("Fetching schema versions..."):
                 try:
-                    response = requests.get(
-                        f"{API_URL}/history/schema",
-                        params={'source_id': st.session_state.source_id}
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        schema_versions = result.get('schema_versions', [])
+                    status_code, payload = fetch_schema_history(st.session_state.source_id)
+
+                    if status_code == 200:
+                        schema_versions = payload.get('schema_versions', [])
                         
                         if schema_versions:
                             st.success(f"Found {len(schema_versions)} schema versions")
@@ -479,14 +740,14 @@ elif page == "History":
                                     st.markdown("---")
                                     with st.expander("📄 View Raw Schema JSON for this Version"):
                                         # We use the entire version_info dictionary, which contains the complete schema
-                                        st.json(version_info)
+                                        render_json_safe(version_info, file_name=f'schema_v{version_num}.json')
                                 
                                 st.markdown('</div>', unsafe_allow_html=True)
 
                         else:
                             st.info("No schema history found for this source ID. Upload a file to create a version.")
                     else:
-                        st.error(f"Error fetching schema history: {response.status_code}")
+                        st.error(f"Error fetching schema history: {status_code}")
                 
                 except Exception as e:
                     st.error(f"Error: {str(e)}")